@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import main
+
+
+# Default database sizes, in students. Instructor and course counts scale with them
+SCALES = (1000, 10000, 100000)
+
+DEPARTMENTS = ('ELEC', 'COMP', 'MATH', 'PHYS', 'CHEM', 'BIOL', 'MECH', 'CIVL', 'HUMN', 'ARCH')
+MAJORS = ('BSEE', 'BSCO', 'BSME', 'BSCE', 'BSAS', 'BCOS')
+SEMESTERS = (('Fall', 2023), ('Spring', 2024), ('Summer', 2024), ('Fall', 2024))
+TITLE_WORDS = ('APPLIED', 'ADVANCED', 'DIGITAL', 'CIRCUIT', 'DESIGN', 'PROGRAMMING', 'CONCEPTS', 'SIGNALS', 'SYSTEMS',
+               'THEORY', 'INTRODUCTION', 'ANALYSIS', 'NETWORKS', 'STRUCTURES', 'MECHANICS', 'CALCULUS', 'ALGEBRA')
+
+# Meeting slots courses are spread over, as (TIME, DAYS)
+TIME_SLOTS = [(f"{hour}:00-{hour}:50", days) for hour in range(8, 17) for days in ('MWF', 'MW', 'WF')] + \
+             [(f"{hour}:00-{hour + 1}:20", days) for hour in range(8, 17, 2) for days in ('TR', 'T', 'R')]
+
+
+# Counts of each table for a scale, in students
+def scale_counts(students):
+    return {'students': students, 'instructors': max(1, students // 20), 'courses': max(10, students // 10),
+            'admins': 5}
+
+
+# Writes a synthetic database shaped like assignment3.db (same tables and column names) to path, then upgrades it
+# with the program's own migrations. A database already at path (from an earlier --keep run) is replaced. Each
+# student is enrolled in up to `enrollments` courses of one semester, and every course gets a capacity with some
+# seats to spare
+def generate_database(path, students, instructors, courses, admins=5, semesters=len(SEMESTERS), enrollments=4,
+                      seed=0):
+    rng = random.Random(seed)
+    terms = SEMESTERS[:semesters]
+    main.pool.closeAll()
+    for stale in (path, path + '-wal', path + '-shm'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(stale)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE STUDENT (ID INT PRIMARY KEY NOT NULL, NAME TEXT NOT NULL, SURNAME TEXT NOT NULL,
+                              GRADYEAR INT NOT NULL, MAJOR CHAR(4) NOT NULL, EMAIL TEXT NOT NULL);
+        CREATE TABLE INSTRUCTOR (ID INT PRIMARY KEY NOT NULL, NAME TEXT NOT NULL, SURNAME TEXT NOT NULL,
+                                 TITLE TEXT NOT NULL, HIREYEAR INT NOT NULL, DEPT CHAR(4) NOT NULL, EMAIL TEXT NOT NULL);
+        CREATE TABLE ADMIN (ID INT PRIMARY KEY NOT NULL, NAME TEXT NOT NULL, SURNAME TEXT NOT NULL,
+                            TITLE TEXT NOT NULL, OFFICE TEXT NOT NULL, EMAIL TEXT NOT NULL);
+        CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT, SEMESTER TEXT, YEAR INTEGER,
+                              CREDITS INTEGER);
+    """)
+    conn.executemany("INSERT INTO STUDENT VALUES (?,?,?,?,?,?)",
+                     ((100000 + n, f'First{n}', f'Last{n}', 2024 + n % 4, rng.choice(MAJORS), f'student{n}')
+                      for n in range(students)))
+    conn.executemany("INSERT INTO INSTRUCTOR VALUES (?,?,?,?,?,?,?)",
+                     ((20000 + n, f'First{n}', f'Last{n}', 'Professor', 1980 + n % 40, rng.choice(DEPARTMENTS),
+                       f'instructor{n}') for n in range(instructors)))
+    conn.executemany("INSERT INTO ADMIN VALUES (?,?,?,?,?,?)",
+                     ((30000 + n, f'First{n}', f'Last{n}', 'Registrar', f'Office {n}', f'admin{n}')
+                      for n in range(admins)))
+
+    course_rows = []
+    for n in range(courses):
+        time_slot, days = rng.choice(TIME_SLOTS)
+        semester, year = terms[n % len(terms)]
+        title = ' '.join(rng.sample(TITLE_WORDS, 3))
+        course_rows.append((40000 + n, title, rng.choice(DEPARTMENTS), time_slot, days, semester, year, rng.randint(1, 4)))
+    conn.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)", course_rows)
+    conn.commit()
+    conn.close()
+
+    main.use_database(path)
+    main.migrate()
+
+    by_term = {}
+    for row in course_rows:
+        by_term.setdefault((row[5], row[6]), []).append(row)
+    enrollment_rows = []
+    for n in range(students):
+        semester, year = terms[n % len(terms)]
+        for row in rng.sample(by_term[semester, year], min(enrollments, len(by_term[semester, year]))):
+            enrollment_rows.append((100000 + n, 'student', row[0], semester, year))
+    for n in range(instructors):
+        row = course_rows[n % len(course_rows)]
+        enrollment_rows.append((20000 + n, 'instructor', row[0], row[5], row[6]))
+    with main.transaction():
+        main.cursor.executemany("""INSERT OR IGNORE INTO enrollment VALUES (?,?,?,?,?)""", enrollment_rows)
+        main.cursor.execute("""INSERT INTO seats (CRN, CAPACITY, TAKEN)
+                               SELECT courses.CRN, COUNT(enrollment.CRN) + 10, COUNT(enrollment.CRN) FROM courses
+                               LEFT JOIN enrollment ON enrollment.CRN = courses.CRN AND enrollment.ROLE = 'student'
+                               GROUP BY courses.CRN""")
+
+
+# The benchmarks, as name: (setup, relative run count). setup(rng, counts) returns the function to time, which
+# does one operation per call
+def bench_login(rng, counts):
+    def run():
+        n = rng.randrange(counts['students'])
+        main.authenticate(f'student{n}', 100000 + n)
+    return run
+
+
+def bench_search_department(rng, counts):
+    def run():
+        semester, year = rng.choice(SEMESTERS)
+        main.search_courses(dept=rng.choice(DEPARTMENTS), semester=semester, year=year)
+    return run
+
+
+def bench_search_keywords(rng, counts):
+    def run():
+        main.search_courses(keywords=' '.join(rng.sample(TITLE_WORDS, 2)), limit=20)
+    return run
+
+
+def bench_search_time_window(rng, counts):
+    def run():
+        main.search_courses(semester='Fall', year=2023, days='MWF', start_after=9 * 60, end_before=13 * 60)
+    return run
+
+
+def loaded_students(rng, counts, how_many=100):
+    students = []
+    for n in rng.sample(range(counts['students']), min(how_many, counts['students'])):
+        member = main.find_user('student', 100000 + n)
+        member.loadSchedule()
+        students.append(member)
+    return students
+
+
+def bench_add_drop_course(rng, counts):
+    students = loaded_students(rng, counts)
+
+    # one add and, if it went through, the matching drop
+    def run():
+        member = rng.choice(students)
+        crn = str(40000 + rng.randrange(counts['courses']))
+        if main.scheduling.change(member, crn, True):
+            main.scheduling.change(member, crn, False)
+    return run
+
+
+def bench_print_schedule(rng, counts):
+    students = loaded_students(rng, counts)
+
+    def run():
+        rng.choice(students).printSchedule()
+    return run
+
+
+def bench_print_roster(rng, counts):
+    admin = main.find_user('admin', 30000)
+
+    def run():
+        admin.printRoster()
+    return run
+
+
+def bench_startup(rng, counts):
+    # what main() does before showing the login screen or running a command: the schema version check. User
+    # registries aren't loaded up front any more
+    def run():
+        main.prepare_database()
+    return run
+
+
+BENCHMARKS = {
+    'login': (bench_login, 1),
+    'search_department': (bench_search_department, 0.5),
+    'search_keywords': (bench_search_keywords, 0.5),
+    'search_time_window': (bench_search_time_window, 0.25),
+    'add_drop_course': (bench_add_drop_course, 1),
+    'print_schedule': (bench_print_schedule, 1),
+    'print_roster': (bench_print_roster, 0.02),
+    'startup': (bench_startup, 0.02),
+}
+
+
+# Times `runs` calls of a benchmark, after a few warm-up calls. Returns timing stats in milliseconds
+def time_benchmark(run, runs, warmup=3):
+    for _ in range(warmup):
+        run()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'runs': runs,
+        'mean_ms': statistics.fmean(timings),
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'min_ms': timings[0],
+        'max_ms': timings[-1],
+        'ops_per_sec': runs / (sum(timings) / 1000) if sum(timings) else None,
+    }
+
+
+# Generates a database of the given size and runs the selected benchmarks against it. Output the benchmarks print
+# is discarded. Returns one result dict per benchmark
+def run_scale(directory, counts, names, repeat, seed=0):
+    path = os.path.join(directory, f"bench_{counts['students']}.db")
+    generate_database(path, counts['students'], counts['instructors'], counts['courses'], counts['admins'],
+                      seed=seed)
+    results = []
+    with open(os.devnull, 'w') as devnull:
+        for name in names:
+            setup, share = BENCHMARKS[name]
+            main.course_cache.invalidate()
+            with contextlib.redirect_stdout(devnull):
+                stats = time_benchmark(setup(random.Random(seed), counts), max(3, int(repeat * share)))
+            results.append({'scale': counts['students'], 'benchmark': name, **counts, **stats})
+            print(f"{counts['students']:>7} {name:<20} median {stats['median_ms']:9.3f} ms   "
+                  f"p95 {stats['p95_ms']:9.3f} ms", file=sys.stderr)
+    main.pool.closeAll()
+    return results
+
+
+# Compares results with a baseline run. Returns a message for each benchmark whose median got slower by more than
+# the tolerance (0.25 is 25%)
+def find_regressions(results, baseline, tolerance):
+    previous = {(result['scale'], result['benchmark']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scale'], result['benchmark']))
+        if before and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append(f"{result['benchmark']} at {result['scale']}: median {before['median_ms']:.3f} ms -> "
+                               f"{result['median_ms']:.3f} ms")
+    return regressions
+
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the registration hot paths on generated databases.")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, metavar='STUDENTS',
+                        help="database sizes to run, in students (default: %(default)s)")
+    parser.add_argument('--students', type=int, help="run one database with this many students instead of --scales")
+    parser.add_argument('--instructors', type=int)
+    parser.add_argument('--courses', type=int)
+    parser.add_argument('--benchmarks', nargs='+', choices=tuple(BENCHMARKS), default=tuple(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=200, help="runs of the quickest benchmarks (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="slowdown of a median over the baseline counted as a regression (default: %(default)s)")
+    parser.add_argument('--keep', metavar='DIR', help="generate the databases in DIR and keep them")
+    args = parser.parse_args(argv)
+
+    if args.students or args.instructors or args.courses:
+        counts = scale_counts(args.students or SCALES[0])
+        counts.update({name: getattr(args, name) for name in ('instructors', 'courses') if getattr(args, name)})
+        all_counts = [counts]
+    else:
+        all_counts = [scale_counts(students) for students in args.scales]
+
+    with contextlib.ExitStack() as stack:
+        directory = args.keep or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(directory, exist_ok=True)
+        results = []
+        for counts in all_counts:
+            results.extend(run_scale(directory, counts, args.benchmarks, args.repeat, args.seed))
+
+    report = {
+        'generated_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
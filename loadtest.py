@@ -0,0 +1,274 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import benchmark
+import main
+
+
+# Operations a simulated student runs, and how often each is picked by default
+DEFAULT_MIX = {'login': 1, 'search': 4, 'add': 3, 'drop': 2}
+
+
+# Reads an operation mix such as "login=1,search=4,add=3,drop=2"
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, separator, weight = part.partition('=')
+        if name not in DEFAULT_MIX or not separator or not weight.isdigit():
+            raise argparse.ArgumentTypeError(f"invalid mix entry {part!r}, use OPERATION=WEIGHT with operations "
+                                             f"{', '.join(DEFAULT_MIX)}")
+        mix[name] = int(weight)
+    return mix
+
+
+# Whether an error is SQLite giving up on a lock ("database is locked" or "database table is locked")
+def is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+
+# What sessions work with: a sample of students as (ID, EMAIL), the CRN's offered in each term, and the departments
+# and title words searches use. Those come from the database itself, so searches on a real database find courses
+def load_workload(sample_size=10000):
+    main.cursor.execute("""SELECT ID, EMAIL FROM student ORDER BY random() LIMIT ?""", (sample_size,))
+    students = main.cursor.fetchall()
+    main.cursor.execute("""SELECT SEMESTER, YEAR, CRN, DEPT, TITLE FROM courses""")
+    terms = {}
+    departments = set()
+    title_words = set()
+    for semester, year, crn, dept, title in main.cursor.fetchall():
+        terms.setdefault(f"{semester} {year}", []).append(str(crn))
+        if dept:
+            departments.add(dept)
+        title_words.update(word for word in (title or '').split() if len(word) > 2 and word.isalpha())
+    return {'students': students, 'terms': terms, 'departments': sorted(departments),
+            'title_words': sorted(title_words)}
+
+
+# One simulated student. Each step picks an operation from the mix, runs it through the program's own code paths
+# and records its latency, or the kind of error it hit
+class LoadSession:
+    def __init__(self, workload, mix, seed):
+        self.rng = random.Random(seed)
+        self.workload = workload
+        self.terms = list(workload['terms'])
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.user = None
+        # every session starts by logging in, whatever the mix
+        self.results = {name: {'latencies': [], 'errors': 0, 'lock_errors': 0} for name in ['login', *mix]}
+
+    def login(self):
+        ID, email = self.rng.choice(self.workload['students'])
+        self.user = main.authenticate(email, ID)
+        self.user.loadSchedule()
+
+    def search(self):
+        semester, year = self.rng.choice(self.terms).split()
+        if self.rng.random() < 0.5 or not self.workload['title_words']:
+            main.search_courses(dept=self.rng.choice(self.workload['departments']), semester=semester,
+                                year=year)
+        else:
+            main.search_courses(keywords=self.rng.choice(self.workload['title_words']), semester=semester, year=year,
+                                limit=20)
+
+    def add(self):
+        main.scheduling.change(self.user, self.rng.choice(self.workload['terms'][self.rng.choice(self.terms)]), True)
+
+    def drop(self):
+        if self.user.schedule:
+            main.scheduling.change(self.user, self.rng.choice(self.user.schedule), False)
+
+    def step(self):
+        name = 'login' if self.user is None else self.rng.choices(self.operations, self.weights)[0]
+        start = time.perf_counter()
+        try:
+            getattr(self, name)()
+        except Exception as error:
+            # anything else (a failed login, say) counts as an error too, and the session carries on
+            self.results[name]['lock_errors' if is_lock_error(error) else 'errors'] += 1
+            return
+        self.results[name]['latencies'].append((time.perf_counter() - start) * 1000)
+
+    # Runs steps until the deadline, pausing think_time seconds between them
+    def run(self, deadline, think_time=0.0):
+        while time.perf_counter() < deadline:
+            self.step()
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+        return self.results
+
+
+# Runs sessions as threads of this process, each on its own pooled connection
+def run_threads(workload, mix, sessions, duration, think_time, seed):
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def session_thread(number):
+        try:
+            session_results = LoadSession(workload, mix, seed + number).run(deadline, think_time)
+            with lock:
+                results.append(session_results)
+        finally:
+            main.pool.releaseThread(close=True)
+
+    threads = [threading.Thread(target=session_thread, args=(number,)) for number in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Body of a session process: opens its own connection to the database, tuned like the parent's, and sends its
+# results back on the queue
+def session_process(path, pragmas, workload, mix, duration, think_time, seed, queue):
+    main.CONNECTION_PRAGMAS = pragmas
+    main.use_database(path)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        queue.put(LoadSession(workload, mix, seed).run(time.perf_counter() + duration, think_time))
+    main.pool.closeAll()
+
+
+# Runs each session in its own process, which takes the GIL out of the picture the way separate terminals would
+def run_processes(path, workload, mix, sessions, duration, think_time, seed):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    processes = [context.Process(target=session_process,
+                                 args=(path, main.CONNECTION_PRAGMAS, workload, mix, duration, think_time,
+                                       seed + number, queue))
+                 for number in range(sessions)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Merges the sessions' results into per-operation counts, throughput and latency percentiles
+def summarize(session_results, elapsed):
+    operations = {}
+    for results in session_results:
+        for name, result in results.items():
+            merged = operations.setdefault(name, {'latencies': [], 'errors': 0, 'lock_errors': 0})
+            merged['latencies'].extend(result['latencies'])
+            merged['errors'] += result['errors']
+            merged['lock_errors'] += result['lock_errors']
+
+    summary = {}
+    for name, merged in operations.items():
+        latencies = sorted(merged['latencies'])
+        summary[name] = {
+            'completed': len(latencies),
+            'errors': merged['errors'],
+            'lock_errors': merged['lock_errors'],
+            'throughput_per_sec': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1] if latencies else None,
+        }
+    completed = sum(operation['completed'] for operation in summary.values())
+    summary['total'] = {
+        'completed': completed,
+        'errors': sum(operation['errors'] for operation in summary.values()),
+        'lock_errors': sum(operation['lock_errors'] for operation in summary.values()),
+        'throughput_per_sec': completed / elapsed,
+    }
+    return summary
+
+
+# Copies a database file (WAL included) with SQLite's backup API, so the load test never touches the original
+def copy_database(source, destination):
+    with contextlib.closing(sqlite3.connect(source)) as original, \
+            contextlib.closing(sqlite3.connect(destination)) as copy:
+        original.backup(copy)
+
+
+def main_loadtest(argv=None):
+    parser = argparse.ArgumentParser(description="Simulates concurrent student sessions against a copy of the "
+                                                 "database and reports throughput, latency and lock errors.")
+    parser.add_argument('--database', help="database to copy and load (default: generate one)")
+    parser.add_argument('--students', type=int, default=10000, help="size of the generated database")
+    parser.add_argument('--sessions', type=int, default=50, help="concurrent sessions (default: %(default)s)")
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run (default: %(default)s)")
+    parser.add_argument('--think-ms', type=float, default=0.0, help="mean pause between a session's operations")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights (default: login=1,search=4,add=3,drop=2)")
+    parser.add_argument('--busy-timeout', type=int, help="override the connections' busy_timeout, in ms")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.busy_timeout is not None:
+        main.CONNECTION_PRAGMAS = tuple(pragma for pragma in main.CONNECTION_PRAGMAS
+                                        if 'busy_timeout' not in pragma) + (f"PRAGMA busy_timeout={args.busy_timeout}",)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'loadtest.db')
+        if args.database:
+            copy_database(args.database, path)
+            main.use_database(path)
+            main.migrate()
+        else:
+            counts = benchmark.scale_counts(args.students)
+            benchmark.generate_database(path, counts['students'], counts['instructors'], counts['courses'],
+                                        seed=args.seed)
+        workload = load_workload()
+        main.pool.closeAll()
+
+        start = time.perf_counter()
+        if args.mode == 'process':
+            session_results = run_processes(path, workload, args.mix, args.sessions, args.duration,
+                                            args.think_ms / 1000, args.seed)
+        else:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                session_results = run_threads(workload, args.mix, args.sessions, args.duration,
+                                              args.think_ms / 1000, args.seed)
+        elapsed = time.perf_counter() - start
+        main.pool.closeAll()
+
+    report = {
+        'config': {'sessions': args.sessions, 'mode': args.mode, 'duration_sec': args.duration,
+                   'think_ms': args.think_ms, 'mix': args.mix, 'database': args.database or f"generated:{args.students}",
+                   'sqlite': sqlite3.sqlite_version},
+        'elapsed_sec': elapsed,
+        'operations': summarize(session_results, elapsed),
+    }
+    for name, operation in report['operations'].items():
+        latency = ''
+        if operation.get('p50_ms') is not None:
+            latency = (f"p50 {operation['p50_ms']:8.3f}  p95 {operation['p95_ms']:8.3f}  "
+                       f"p99 {operation['p99_ms']:8.3f} ms")
+        print(f"{name:<7} {operation['throughput_per_sec']:9.1f}/s  {latency}  errors {operation['errors']}  "
+              f"locked {operation['lock_errors']}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_loadtest())
@@ -1,16 +1,1108 @@
+import argparse
+import asyncio
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import functools
+import io
+import json
+import os
+import queue
+import shlex
+import signal
 import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
 import unittest
 from unittest import TestCase
 from unittest.mock import patch
 
 
-# Using the database from assignment 3
-db = sqlite3.connect('assignment3.db')
-cursor = db.cursor()
+# PRAGMAs applied to every connection. busy_timeout makes a blocked writer wait for the lock instead of failing
+# straight away with "database is locked"
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+# Upper bounds, in milliseconds, of the latency histogram buckets. Anything slower goes in one last overflow bucket
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Queries at least this slow are written to the slow query log with their parameters
+SLOW_QUERY_MS = float(os.environ.get('REGISTRATION_SLOW_QUERY_MS', 100))
+
+
+# Collapses the whitespace of a query so the same statement is counted once however it was indented
+@functools.lru_cache(maxsize=1024)
+def query_key(sql):
+    return ' '.join(sql.split())
+
+
+# Call count, rows, errors and latency histogram of one query or operation
+class TimingStats:
+    __slots__ = ('calls', 'rows', 'errors', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.calls = self.rows = self.errors = 0
+        self.total_ms = self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    # Upper bound of the bucket holding the given fraction of calls, or the slowest call if that is the overflow
+    def percentile(self, fraction):
+        rank = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self, rows=True):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': self.calls,
+            **({'rows': self.rows} if rows else {}),
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else None,
+            'p50_ms': self.percentile(0.50) if self.calls else None,
+            'p95_ms': self.percentile(0.95) if self.calls else None,
+            'p99_ms': self.percentile(0.99) if self.calls else None,
+            'max_ms': round(self.max_ms, 3),
+            'histogram': {label: count for label, count in zip(labels, self.buckets) if count},
+        }
+
+
+# Counters for every query run through the module cursor and every timed user operation, plus a log of the slow
+# queries. It is always on: recording a call is two clock reads and a few additions under a lock
+class Metrics:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_log_size=200, slow_log_path=None):
+        self.lock = threading.Lock()
+        self.slow_query_ms = slow_query_ms
+        self.slow_log_path = slow_log_path
+        self.reset(slow_log_size)
+
+    def reset(self, slow_log_size=None):
+        with self.lock:
+            self.started = time.time()
+            self.queries = collections.defaultdict(TimingStats)
+            self.operations = collections.defaultdict(TimingStats)
+            self.slow_queries = collections.deque(maxlen=slow_log_size or self.slow_queries.maxlen)
+
+    # Returns the stats a query is counted under, so rows fetched afterwards can be added to it
+    def recordQuery(self, sql, params, elapsed_ms, failed=False):
+        key = query_key(sql)
+        with self.lock:
+            stats = self.queries[key]
+            stats.add(elapsed_ms, failed)
+        if elapsed_ms >= self.slow_query_ms:
+            self.logSlowQuery(key, params, elapsed_ms)
+        return stats
+
+    def addRows(self, stats, rows):
+        with self.lock:
+            stats.rows += rows
+
+    def logSlowQuery(self, sql, params, elapsed_ms):
+        entry = {'at': time.strftime('%Y-%m-%d %H:%M:%S'), 'ms': round(elapsed_ms, 3), 'sql': sql,
+                 'params': params if isinstance(params, dict) else list(params)}
+        with self.lock:
+            self.slow_queries.append(entry)
+        if self.slow_log_path:
+            with open(self.slow_log_path, 'a') as log:
+                log.write(json.dumps(entry, default=str) + '\n')
+
+    # Times a with block as one call of a user operation, counting it as an error if it raises
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.operations[name].add(elapsed_ms, failed)
+
+    # Everything recorded so far, with the queries slowest in total first, plus the course cache and scheduling
+    # counters
+    def stats(self):
+        with self.lock:
+            stats = {
+                'uptime_sec': round(time.time() - self.started, 3),
+                'slow_query_ms': self.slow_query_ms,
+                'operations': {name: stats.summary(rows=False) for name, stats in sorted(self.operations.items())},
+                'queries': {sql: stats.summary() for sql, stats in
+                            sorted(self.queries.items(), key=lambda item: -item[1].total_ms)},
+                'slow_queries': list(self.slow_queries),
+            }
+        stats['course_cache'] = course_cache.stats()
+        stats['scheduling'] = scheduling.stats()
+        return stats
+
+    # Writes the stats as JSON to a file name, an open file, or stdout
+    def dump(self, out=None):
+        text = json.dumps(self.stats(), indent=2, default=str) + '\n'
+        if isinstance(out, str):
+            with open(out, 'w') as file:
+                file.write(text)
+        else:
+            (out or sys.stdout).write(text)
+
+
+metrics = Metrics(slow_log_path=os.environ.get('REGISTRATION_SLOW_QUERY_LOG'))
+
+
+# Decorator that times every call of a function as the named user operation
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.timed(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Writes the stats to the file named by REGISTRATION_METRICS, if it is set, when the program exits
+def dump_metrics_at_exit():
+    path = os.environ.get('REGISTRATION_METRICS')
+    if path:
+        metrics.dump(path)
+
+
+atexit.register(dump_metrics_at_exit)
+
+
+# Lets a running program be asked for its stats with SIGUSR1. They go where the exit dump would, or to stderr. The
+# handler runs on the main thread, maybe while it holds a lock the dump needs, so it only wakes a helper thread
+# that does the dump
+def install_metrics_signal():
+    if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+        return
+    requested = threading.Event()
+
+    def dump_on_request():
+        while True:
+            requested.wait()
+            requested.clear()
+            metrics.dump(os.environ.get('REGISTRATION_METRICS') or sys.stderr)
+
+    threading.Thread(target=dump_on_request, name='metrics-dump', daemon=True).start()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: requested.set())
+
+
+# Pool of tuned connections to one database file. Each thread (or session) gets its own connection, taken from the
+# idle connections when there is one, and gives it back when it is done
+class ConnectionPool:
+    def __init__(self, database, max_idle=8):
+        self.database = database
+        self.idle = queue.LifoQueue(max_idle)
+        self.local = threading.local()
+
+    def open(self):
+        connection = sqlite3.connect(self.database, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.open()
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    # Returns the calling thread's connection, taking one from the pool on first use
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.acquire()
+            self.local.cursor = connection.cursor()
+        return connection
+
+    def cursor(self):
+        self.connection()
+        return self.local.cursor
+
+    # Gives the calling thread's connection back to the pool, or closes it for good
+    def releaseThread(self, close=False):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            return
+        self.local.connection = self.local.cursor = None
+        if close:
+            connection.close()
+        else:
+            self.release(connection)
+
+    # Binds a pooled connection to the calling thread for the duration of a with block
+    @contextlib.contextmanager
+    def session(self):
+        self.connection()
+        try:
+            yield self.local.connection
+        finally:
+            self.releaseThread()
+
+    def closeAll(self):
+        self.releaseThread(close=True)
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Module level stand-ins for a connection and cursor. They forward to the calling thread's pooled connection, so
+# code can keep using db and cursor while every thread works on its own connection
+class ThreadConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.pool.connection(), name)
+
+    def close(self):
+        self.pool.releaseThread(close=True)
+
+
+class ThreadCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.pool.cursor(), name)
+
+    # Runs a query on the thread's cursor and records it in the metrics. Rows fetched afterwards are counted
+    # against it
+    def execute(self, sql, params=()):
+        cursor = self.pool.cursor()
+        start = time.perf_counter()
+        failed = True
+        try:
+            cursor.execute(sql, params)
+            failed = False
+        finally:
+            self.pool.local.query_stats = metrics.recordQuery(sql, params, (time.perf_counter() - start) * 1000,
+                                                              failed)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        cursor = self.pool.cursor()
+        start = time.perf_counter()
+        failed = True
+        try:
+            cursor.executemany(sql, seq_of_params)
+            failed = False
+        finally:
+            # the parameters may be a spent generator, so the slow log only gets how many rows were written
+            self.pool.local.query_stats = metrics.recordQuery(sql, {'executemany': cursor.rowcount},
+                                                              (time.perf_counter() - start) * 1000, failed)
+        return self
+
+    def countRows(self, rows):
+        stats = getattr(self.pool.local, 'query_stats', None)
+        if stats is not None and rows:
+            metrics.addRows(stats, rows)
+
+    def fetchone(self):
+        row = self.pool.cursor().fetchone()
+        self.countRows(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        cursor = self.pool.cursor()
+        rows = cursor.fetchmany(cursor.arraysize if size is None else size)
+        self.countRows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.pool.cursor().fetchall()
+        self.countRows(len(rows))
+        return rows
+
+    def __iter__(self):
+        count = 0
+        try:
+            for row in self.pool.cursor():
+                count += 1
+                yield row
+        finally:
+            self.countRows(count)
+
+
+# Using the database from assignment 3. Connections are opened on first use
+pool = ConnectionPool('assignment3.db')
+db = ThreadConnection(pool)
+cursor = ThreadCursor(pool)
+
+
+# Points the program at another database file, such as a generated one for benchmarks. Idle connections to the old
+# file are closed, and cached course data is dropped as it came from the old file
+def use_database(path):
+    global pool, db, cursor, course_column_cache
+    pool.closeAll()
+    pool = ConnectionPool(path)
+    db = ThreadConnection(pool)
+    cursor = ThreadCursor(pool)
+    course_column_cache = None
+    course_cache.invalidate()
+
+
+# Runs a with block as one transaction: committed once when the block finishes and rolled back if anything in it
+# raises. Nested blocks join the outermost one, so a caller can batch helpers that open their own transaction
+@contextlib.contextmanager
+def transaction():
+    depth = getattr(pool.local, 'transaction_depth', 0)
+    pool.local.transaction_depth = depth + 1
+    try:
+        yield
+    except BaseException:
+        if depth == 0:
+            db.rollback()
+        raise
+    else:
+        if depth == 0:
+            db.commit()
+    finally:
+        pool.local.transaction_depth = depth
+
+
+# Converts a "H:MM" (or "HHMM") time to minutes after midnight
+def time_to_minutes(time):
+    time = time.strip()
+    if ':' in time:
+        hours, minutes = time.split(':')
+    else:
+        hours, minutes = time[:-2], time[-2:]
+    return int(hours) * 60 + int(minutes)
+
+
+# Parses a course TIME such as "8:00-9:50" into a (start, end) minute range. Returns None if it can't be read
+def parse_time_range(time):
+    if not isinstance(time, str) or '-' not in time:
+        return None
+    start, end = time.split('-', 1)
+    try:
+        return time_to_minutes(start), time_to_minutes(end)
+    except ValueError:
+        return None
+
+
+# Meeting day codes in weekday order. A set of days is kept as a bitmask, bit i standing for DAY_CODES[i]
+DAY_CODES = 'MTWRFSU'
+DAY_NAMES = {'M': 'Monday', 'T': 'Tuesday', 'W': 'Wednesday', 'R': 'Thursday', 'F': 'Friday',
+             'S': 'Saturday', 'U': 'Sunday'}
+
+
+# Turns a DAYS string such as "MWF" into a day bitmask. Unknown codes are ignored
+def day_mask(days):
+    mask = 0
+    for day in days if isinstance(days, str) else '':
+        if day in DAY_CODES:
+            mask |= 1 << DAY_CODES.index(day)
+    return mask
+
+
+# Lists the day codes set in a day bitmask, in weekday order
+def mask_days(mask):
+    return [day for i, day in enumerate(DAY_CODES) if mask & (1 << i)]
+
+
+# Parsed meeting time of a course: START and END in minutes after midnight (None if TIME can't be read) and
+# DAYS as a day bitmask
+MeetingTime = collections.namedtuple('MeetingTime', ['START', 'END', 'DAYS'])
+
+
+# Parses a course's TIME and DAYS strings. Sections share a small set of time slots, so each distinct pair is
+# only ever parsed once and every later lookup is a dict hit
+@functools.lru_cache(maxsize=None)
+def meeting_time(time, days):
+    start, end = parse_time_range(time) or (None, None)
+    return MeetingTime(start, end, day_mask(days))
+
+
+# The key a CRN goes by in the course cache and in schedules: its digits without padding or leading zeros, so
+# '033950', ' 33950' and 33950 are the same course. Anything else is kept as typed, stripped, and matches no course
+def crn_key(crn):
+    text = str(crn).strip()
+    return str(int(text)) if text.isascii() and text.isdigit() else text
+
+
+# A row of the courses table. Fields are read by name, and as a tuple it costs no more memory than the raw row
+class Course(collections.namedtuple('Course', ['CRN', 'TITLE', 'DEPT', 'TIME', 'DAYS', 'SEMESTER', 'YEAR', 'CREDITS'])):
+    __slots__ = ()
+
+    @property
+    def meeting(self):
+        return meeting_time(self.TIME, self.DAYS)
+
+
+# Turns a courses row into a Course. Anything that isn't a plain row (None, or a Course already) is passed through
+def course_record(row):
+    if type(row) is tuple:
+        return Course(*row)
+    return row
+
+
+# Interval index over the meeting blocks of a schedule. Blocks are kept per (semester, year, day) in a list
+# sorted by start time, next to a running maximum of their end times, so checking a course for overlaps is a bisect
+# instead of a query per scheduled CRN. A stored schedule can hold overlapping blocks (an import, a waitlist
+# promotion, or a course whose time was edited after enrolling), and the running maximum keeps the lookup correct
+# for those too. Adding or removing a block updates the maxima after it, which is linear in the day's blocks.
+class ScheduleIndex:
+    def __init__(self, courses=()):
+        self.blocks = {}
+        self.max_ends = {}  # per key, max_ends[i] is the latest end among blocks[0..i]
+        self.courses = {}
+        self.scheduled = set()  # CRN's the index covers, including any that had no course row
+        for course in courses:
+            self.add(course)
+
+    # Yields the (key, start, end) meeting blocks of a course row
+    @staticmethod
+    def meetingBlocks(course):
+        meeting = course.meeting
+        if meeting.START is None:
+            return
+        for day in mask_days(meeting.DAYS):
+            yield (course.SEMESTER, course.YEAR, day), meeting.START, meeting.END
+
+    # Recomputes the running maximum of end times for a key's blocks from position i on
+    def updateMaxEnds(self, key, i):
+        day_blocks = self.blocks[key]
+        max_ends = self.max_ends[key]
+        del max_ends[i:]
+        latest = max_ends[-1] if max_ends else 0
+        for start, end, crn in day_blocks[i:]:
+            latest = max(latest, end)
+            max_ends.append(latest)
+
+    def add(self, course, crn=None):
+        crn = crn_key(course.CRN if crn is None else crn)
+        self.courses[crn] = course
+        self.scheduled.add(crn)
+        for key, start, end in self.meetingBlocks(course):
+            day_blocks = self.blocks.setdefault(key, [])
+            self.max_ends.setdefault(key, [])
+            i = bisect.bisect_left(day_blocks, (start, end, crn))
+            day_blocks.insert(i, (start, end, crn))
+            self.updateMaxEnds(key, i)
+
+    def remove(self, crn):
+        crn = crn_key(crn)
+        self.scheduled.discard(crn)
+        course = self.courses.pop(crn, None)
+        if course is None:
+            return
+        for key, start, end in self.meetingBlocks(course):
+            day_blocks = self.blocks[key]
+            i = bisect.bisect_left(day_blocks, (start, end, crn))
+            del day_blocks[i]
+            self.updateMaxEnds(key, i)
+
+    # Returns the scheduled course rows whose meeting times overlap the given course row. Blocks starting before
+    # this one ends are candidates; walking back from the last of them stops as soon as no earlier block ends after
+    # this one starts, so only the overlapping blocks (and any short ones nested among them) are visited
+    def conflicts(self, course):
+        conflicting = {}
+        for key, start, end in self.meetingBlocks(course):
+            day_blocks = self.blocks.get(key)
+            if not day_blocks:
+                continue
+            max_ends = self.max_ends[key]
+            i = bisect.bisect_left(day_blocks, (end,))
+            while i > 0 and max_ends[i - 1] > start:
+                i -= 1
+                if day_blocks[i][1] > start:
+                    conflicting[day_blocks[i][2]] = self.courses[day_blocks[i][2]]
+        return list(conflicting.values())
+
+
+# CRN's bound per course fetch query. Every query binds exactly this many (the last chunk is padded with NULL,
+# which matches nothing), so the SQL text never changes and the connection's statement cache keeps it prepared
+COURSE_FETCH_CHUNK_SIZE = 64
+FETCH_COURSES_QUERY = """SELECT * FROM courses WHERE CRN IN ({})""".format(','.join('?' * COURSE_FETCH_CHUNK_SIZE))
+
+
+# Fetches the Course records for any number of CRN's, a chunk of bound parameters at a time. An instructor with
+# hundreds of sections stays well under SQLite's variable limit, and an empty list runs no query at all
+def fetch_courses(crns):
+    crns = list(dict.fromkeys(crn_key(crn) for crn in crns))
+    courses = []
+    for i in range(0, len(crns), COURSE_FETCH_CHUNK_SIZE):
+        chunk = crns[i:i + COURSE_FETCH_CHUNK_SIZE]
+        cursor.execute(FETCH_COURSES_QUERY, chunk + [None] * (COURSE_FETCH_CHUNK_SIZE - len(chunk)))
+        courses.extend(map(course_record, cursor.fetchall()))
+    return courses
+
+
+# Most course rows the course cache holds before evicting the least recently used
+COURSE_CACHE_SIZE = 2048
+
+
+# Read-through LRU cache of Course records keyed by CRN. Records are named tuples, so nothing handed out can be
+# changed in place. Admin writes to courses must call invalidate(). hits and misses show how well the cache is sized
+class CourseCache:
+    def __init__(self, max_size=COURSE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the course row for a CRN, or None if there is no such course. Only a miss touches the database
+    def get(self, crn):
+        key = crn_key(crn)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        cursor.execute("""SELECT * FROM courses WHERE CRN=?""", (key,))
+        course = course_record(cursor.fetchone())
+        if course is not None:
+            self.put(key, course)
+        return course
+
+    # Returns {CRN: course row} for the CRN's that exist, in the order given. Misses are fetched in batches
+    def getMany(self, crns):
+        keys = list(dict.fromkeys(crn_key(crn) for crn in crns))
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    found[key] = self.entries[key]
+                else:
+                    self.misses += 1
+                    missing.append(key)
+        for course in fetch_courses(missing):
+            found[crn_key(course.CRN)] = course
+            self.put(crn_key(course.CRN), course)
+        return {key: found[key] for key in keys if key in found}
+
+    def put(self, key, course):
+        with self.lock:
+            self.entries[key] = course
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # Drops one CRN from the cache, or everything if no CRN is given
+    def invalidate(self, crn=None):
+        with self.lock:
+            if crn is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(crn_key(crn), None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'max_size': self.max_size}
+
+
+course_cache = CourseCache()
+
+
+# Indexes the meeting times of a list of CRN's, reading their course rows through the course cache
+def build_schedule_index(schedule):
+    index = ScheduleIndex()
+    for crn, course in course_cache.getMany(schedule).items():
+        index.add(course, crn)
+    index.scheduled.update(crn_key(crn) for crn in schedule)
+    return index
+
+
+# Whether the database has a table with this name
+def table_exists(name):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=? COLLATE NOCASE", (name,))
+    return cursor.fetchone() is not None
+
+
+# Starts a transaction explicitly. sqlite3 only opens one on its own before INSERT, UPDATE and DELETE, so work that
+# starts with CREATE, DROP or ALTER has to ask for it to be atomic. mode can be IMMEDIATE to take the write lock now
+def begin(mode=''):
+    if not db.in_transaction:
+        cursor.execute(f"BEGIN {mode}".strip())
+
+
+# Columns of the courses table. CRN is the INTEGER PRIMARY KEY, so it is the rowid and a CRN lookup is a b-tree seek
+COURSES_TABLE_COLUMNS = """
+            CRN INTEGER PRIMARY KEY,
+            TITLE TEXT,
+            DEPT TEXT,
+            TIME TEXT,
+            DAYS TEXT,
+            SEMESTER TEXT,
+            YEAR INTEGER,
+            CREDITS INTEGER
+"""
+
+
+# Creates the courses table if this database doesn't have it yet. Returns whether it had to be created
+def create_courses_table():
+    if table_exists('courses'):
+        return False
+    with transaction():
+        begin()
+        cursor.execute(f"""CREATE TABLE courses ({COURSES_TABLE_COLUMNS})""")
+        create_course_indexes()
+    return True
+
+
+# Creates the enrollment table if this database doesn't have it yet. Rows are clustered by user for schedule
+# lookups, and the CRN index covers per-section queries such as class lists and fill counts.
+def create_enrollment_table():
+    with transaction():
+        cursor.execute("""CREATE TABLE IF NOT EXISTS enrollment (
+                            USER_ID INTEGER NOT NULL,
+                            ROLE TEXT NOT NULL,
+                            CRN INTEGER NOT NULL,
+                            SEMESTER TEXT,
+                            YEAR INTEGER,
+                            PRIMARY KEY (USER_ID, ROLE, CRN)
+                        ) WITHOUT ROWID""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS enrollment_crn ON enrollment (CRN, ROLE, USER_ID)""")
+
+
+# Indexes for the course lookups the menus run most: by term and department, and by title prefix. CRN lookups use
+# the primary key
+def create_course_indexes():
+    with transaction():
+        cursor.execute("""CREATE INDEX IF NOT EXISTS courses_term_dept ON courses (SEMESTER, YEAR, DEPT)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS courses_dept ON courses (DEPT)""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS courses_title ON courses (TITLE COLLATE NOCASE)""")
+        create_course_search_index()
+
+
+# Full-text index over course titles for ranked keyword search. It is an external content FTS5 table, so it only
+# stores the index, and triggers keep it in step with every insert, update and delete on courses. Returns False if
+# this SQLite build has no FTS5, in which case keyword searches fall back to LIKE
+def create_course_search_index():
+    if table_exists('courses_fts'):
+        return True
+    with transaction():
+        try:
+            cursor.execute("""CREATE VIRTUAL TABLE courses_fts USING fts5(TITLE, content='courses', content_rowid='rowid')""")
+        except sqlite3.OperationalError:
+            return False
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS courses_fts_insert AFTER INSERT ON courses BEGIN
+                              INSERT INTO courses_fts (rowid, TITLE) VALUES (new.rowid, new.TITLE);
+                          END""")
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS courses_fts_delete AFTER DELETE ON courses BEGIN
+                              INSERT INTO courses_fts (courses_fts, rowid, TITLE) VALUES ('delete', old.rowid, old.TITLE);
+                          END""")
+        cursor.execute("""CREATE TRIGGER IF NOT EXISTS courses_fts_update AFTER UPDATE ON courses BEGIN
+                              INSERT INTO courses_fts (courses_fts, rowid, TITLE) VALUES ('delete', old.rowid, old.TITLE);
+                              INSERT INTO courses_fts (rowid, TITLE) VALUES (new.rowid, new.TITLE);
+                          END""")
+        cursor.execute("""INSERT INTO courses_fts (courses_fts) VALUES ('rebuild')""")
+    return True
+
+
+# Schema version 1: the enrollment table, plus the course indexes if there is a courses table
+def migrate_base_tables():
+    create_enrollment_table()
+    if table_exists('courses'):
+        create_course_indexes()
+
+
+# Raised when the database can't be upgraded without someone fixing its data first
+class MigrationError(Exception):
+    pass
+
+
+# Schema version 2: rebuilds an old courses table with CRN as its primary key. CRN's are stored as numbers, so
+# '033950' and 33950 become one course, and a CRN listed more than once keeps its last row. Raises MigrationError,
+# naming the rows, if any CRN isn't a number. The search index is recreated over the new table, as its rowids change
+def migrate_courses_primary_key():
+    if not table_exists('courses'):
+        return
+    cursor.execute("""SELECT pk FROM pragma_table_info('courses') WHERE name='CRN'""")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("""SELECT rowid, CRN, TITLE FROM courses
+                      WHERE CRN IS NULL OR trim(CRN) = '' OR trim(CRN) GLOB '*[^0-9]*'""")
+    invalid = cursor.fetchall()
+    if invalid:
+        rows = '; '.join(f"row {rowid}: CRN {crn!r} ({title})" for rowid, crn, title in invalid[:10])
+        more = f" and {len(invalid) - 10} more" if len(invalid) > 10 else ""
+        raise MigrationError(f"courses has CRN's that aren't numbers, fix or remove these rows and start "
+                             f"again: {rows}{more}")
+    cursor.execute("""DROP TABLE IF EXISTS courses_fts""")
+    cursor.execute(f"""CREATE TABLE courses_rebuilt ({COURSES_TABLE_COLUMNS})""")
+    cursor.execute("""INSERT OR REPLACE INTO courses_rebuilt
+                      SELECT CAST(trim(CRN) AS INTEGER), TITLE, DEPT, TIME, DAYS, SEMESTER, YEAR, CREDITS
+                      FROM courses ORDER BY rowid""")
+    cursor.execute("""DROP TABLE courses""")
+    cursor.execute("""ALTER TABLE courses_rebuilt RENAME TO courses""")
+    create_course_indexes()
+
+
+# Schema version 3: an EMAIL index on each user table. It is unique unless the table already has two users with the
+# same email, in which case it gets a plain index and a one-time warning. The plain index stays: this migration
+# isn't run again, so the duplicates have to be removed and the index recreated as UNIQUE by hand
+def migrate_email_indexes():
+    for table in ('admin', 'instructor', 'student'):
+        if not table_exists(table):
+            continue
+        try:
+            cursor.execute(f"""CREATE UNIQUE INDEX IF NOT EXISTS {table}_email ON {table} (EMAIL)""")
+        except sqlite3.IntegrityError:
+            print(f"Warning: {table} has duplicate emails, so its email index can't be unique.")
+            cursor.execute(f"""CREATE INDEX IF NOT EXISTS {table}_email ON {table} (EMAIL)""")
+
+
+# Creates the seat counter and waitlist tables if this database doesn't have them yet. A section only has a seats
+# row once it has a capacity, and waitlist order is the order of ID within a CRN
+def create_seat_tables():
+    with transaction():
+        cursor.execute("""CREATE TABLE IF NOT EXISTS seats (
+                            CRN INTEGER PRIMARY KEY,
+                            CAPACITY INTEGER NOT NULL CHECK (CAPACITY >= 0),
+                            TAKEN INTEGER NOT NULL DEFAULT 0 CHECK (TAKEN BETWEEN 0 AND CAPACITY)
+                        )""")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS waitlist (
+                            ID INTEGER PRIMARY KEY,
+                            CRN INTEGER NOT NULL,
+                            USER_ID INTEGER NOT NULL,
+                            UNIQUE (CRN, USER_ID)
+                        )""")
+        cursor.execute("""CREATE INDEX IF NOT EXISTS waitlist_order ON waitlist (CRN, ID)""")
+
+
+# Schema version 4: section capacities and waitlists
+def migrate_seat_tables():
+    create_seat_tables()
+
+
+# Schema migrations in order. A database's schema version, kept in PRAGMA user_version, is the number of them it
+# has had applied. Only ever append to this list
+MIGRATIONS = [
+    migrate_base_tables,
+    migrate_courses_primary_key,
+    migrate_email_indexes,
+    migrate_seat_tables,
+]
+
+
+# Journal mode for databases the program creates or upgrades. WAL lets readers run alongside a writer. It is stored
+# in the database file, so it is set once by migrate rather than by every connection, and a file that is only
+# opened (never upgraded) keeps the mode it came with
+JOURNAL_MODE_PRAGMA = "PRAGMA journal_mode=WAL"
+
+
+# Upgrades the database in place to the latest schema version, each migration in its own transaction together with
+# the version bump, and switches an upgraded database to WAL. With nothing pending this is a single PRAGMA read.
+# Returns the number of migrations applied
+@timed('migrate')
+def migrate():
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    pending = MIGRATIONS[version:]
+    for number, migration in enumerate(pending, version + 1):
+        with transaction():
+            begin()
+            migration()
+            cursor.execute(f"PRAGMA user_version={number}")
+    if pending:
+        cursor.execute(JOURNAL_MODE_PRAGMA)
+        cursor.fetchall()
+        course_cache.invalidate()
+    return len(pending)
+
+
+# Column names of the courses table, read with PRAGMA once and then reused
+course_column_cache = None
+
+
+def course_columns():
+    global course_column_cache
+    if course_column_cache is None:
+        cursor.execute("PRAGMA table_info(courses)")
+        course_column_cache = [column[1] for column in cursor.fetchall()]
+    return course_column_cache
+
+
+# Escapes the LIKE wildcards in text typed by a user
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# Whether a course meets only on the given days and inside the given time window (minutes after midnight)
+def course_fits(course, days=None, start_after=None, end_before=None):
+    meeting = course.meeting
+    if days and meeting.DAYS & ~day_mask(days):
+        return False
+    if start_after is None and end_before is None:
+        return True
+    if meeting.START is None:
+        return False
+    return ((start_after is None or meeting.START >= start_after)
+            and (end_before is None or meeting.END <= end_before))
+
+
+# Runs a course query built by search_courses and returns the rows
+def select_courses(source, conditions, params, order_by=None, limit=None):
+    query = f"SELECT courses.* FROM {source}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limit:
+        query += " LIMIT ?"
+        params = [*params, limit]
+    cursor.execute(query, params)
+    return [course_record(row) for row in cursor.fetchall()]
+
+
+# Searches the courses table with any combination of filters. Department, term, credits and title are matched in
+# SQL using the course indexes. A title ending in * matches titles that start with it, anything else matches
+# titles containing it. keywords runs a ranked full-text search on titles where each word may be the start of a
+# title word. days keeps courses that meet only on those days, and start_after/end_before (minutes after midnight)
+# keep courses inside that time window. Results are sorted by sort (a courses column; by default keyword rank,
+# then CRN) and cut to limit
+@timed('search')
+def search_courses(dept=None, semester=None, year=None, days=None, start_after=None, end_before=None,
+                   min_credits=None, max_credits=None, title=None, keywords=None, sort=None, limit=None):
+    conditions = []
+    params = []
+    for column, value in (('DEPT', dept), ('SEMESTER', semester), ('YEAR', year)):
+        if value:
+            conditions.append(f"courses.{column}=?")
+            params.append(value)
+    if min_credits is not None:
+        conditions.append("courses.CREDITS>=?")
+        params.append(min_credits)
+    if max_credits is not None:
+        conditions.append("courses.CREDITS<=?")
+        params.append(max_credits)
+    if title:
+        if title.endswith('*'):
+            pattern = escape_like(title[:-1]) + '%'
+        else:
+            pattern = '%' + escape_like(title) + '%'
+        conditions.append("courses.TITLE LIKE ? ESCAPE '\\'")
+        params.append(pattern)
+
+    if sort is not None and sort not in course_columns():
+        raise ValueError(f"can't sort by {sort}")
+    # TIME is text, so it's sorted below on the parsed start time instead
+    order_by = f"courses.{sort}" if sort and sort != 'TIME' else None
+    filter_in_python = days or start_after is not None or end_before is not None
+    sql_limit = None if filter_in_python or sort == 'TIME' else limit
+
+    results = None
+    words = keywords.split() if keywords else []
+    if words:
+        match = ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+        try:
+            results = select_courses("courses JOIN courses_fts ON courses_fts.rowid = courses.rowid",
+                                      conditions + ["courses_fts MATCH ?"], params + [match],
+                                      order_by or "courses_fts.rank", sql_limit)
+        except sqlite3.OperationalError:
+            # no full-text index in this database, so fall back to finding each word anywhere in the title
+            for word in words:
+                conditions.append("courses.TITLE LIKE ? ESCAPE '\\'")
+                params.append('%' + escape_like(word) + '%')
+    if results is None:
+        results = select_courses("courses", conditions, params, order_by or "courses.CRN", sql_limit)
+
+    if filter_in_python:
+        results = [course for course in results if course_fits(course, days, start_after, end_before)]
+    if sort == 'TIME':
+        results.sort(key=time_order)
+    if limit:
+        results = results[:limit]
+    return results
+
+
+# Asks for search filters (blank skips one), then runs the search and prints the matching courses
+def search_course_prompt():
+    print("Search courses - leave a field blank to skip it")
+    dept = input("Department: ")
+    semester = input("Semester: ")
+    year = input("Year: ")
+    days = input("Only on days (e.g. MWF): ").upper()
+    start_after = input("Starting at or after (H:MM): ")
+    end_before = input("Ending by (H:MM): ")
+    min_credits = input("Minimum credits: ")
+    max_credits = input("Maximum credits: ")
+    title = input("Title contains (end with * to match the start of the title): ")
+    keywords = input("Title keywords (ranked by relevance, partial words allowed): ")
+    sort = input(f"Sort by ({', '.join(course_columns())}): ").upper() or None
+    limit = input("Maximum number of results: ")
+
+    try:
+        start_after = time_to_minutes(start_after) if start_after else None
+        end_before = time_to_minutes(end_before) if end_before else None
+    except ValueError:
+        print("Invalid time, please use H:MM.")
+        return
+    numbers = (year, min_credits, max_credits, limit)
+    if not all(number == '' or number.isdigit() for number in numbers):
+        print("Year, credits and maximum results must be whole numbers.")
+        return
+    if sort is not None and sort not in course_columns():
+        print("Invalid sort column.")
+        return
+
+    results = search_courses(dept, semester, year, days,
+                             start_after, end_before,
+                             int(min_credits) if min_credits else None,
+                             int(max_credits) if max_credits else None,
+                             title, keywords, sort, int(limit) if limit else None)
+    print_search_results(results)
+
+
+def print_search_results(results):
+    if results:
+        print("Search Results:")
+        for row in results:
+            print(row)
+    else:
+        print("No results found.")
+
+
+# Number of rows pulled from the cursor at a time when streaming a table
+STREAM_BATCH_SIZE = 500
+
+
+# Formats a row the way print(*row) would
+def format_fields(row):
+    return ' '.join(str(field) for field in row)
 
 
-# User parent class definition
+# Writes every row of a query to out in fetchmany batches with one write per batch, so memory stays flat no
+# matter how many rows the query returns
+def stream_rows(query, params=(), format_row=str, out=None, batch_size=STREAM_BATCH_SIZE):
+    out = out or sys.stdout
+    cursor.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        out.write(''.join(format_row(row) + '\n' for row in rows))
+    out.flush()
+
+
+# Shows a query page_size rows at a time with next/prev navigation. Each page is its own LIMIT/OFFSET query so only
+# one page is ever held in memory
+def page_rows(query, params=(), page_size=20, format_row=str, out=None, operation='print_page'):
+    out = out or sys.stdout
+    page = 0
+    while True:
+        # each page is timed on its own, leaving out the wait for the user's next choice
+        with metrics.timed(operation):
+            cursor.execute(f"{query} LIMIT ? OFFSET ?", (*params, page_size + 1, page * page_size))
+            rows = cursor.fetchall()
+            out.write(''.join(format_row(row) + '\n' for row in rows[:page_size]))
+            out.flush()
+        has_next = len(rows) > page_size
+
+        while True:
+            choice = input(f"Page {page + 1} - (n)ext, (p)revious or (q)uit: ").lower()
+            if choice == "n" and has_next:
+                page += 1
+                break
+            elif choice == "p" and page > 0:
+                page -= 1
+                break
+            elif choice == "q":
+                return
+            elif choice in ("n", "p"):
+                print("No more pages in that direction.")
+            else:
+                print("Invalid choice.")
+
+
+# Prints a query either streamed in full or, if page_size is given, one page at a time. The printing is timed as
+# the named operation, one call per page when paging
+def print_rows(query, params=(), page_size=None, format_row=str, operation='print_rows'):
+    if page_size:
+        page_rows(query, params, page_size, format_row, operation=operation)
+    else:
+        with metrics.timed(operation):
+            stream_rows(query, params, format_row)
+
+
+# Sort key putting courses in meeting-time order. Courses with an unreadable TIME go last
+def time_order(course):
+    meeting = course.meeting
+    if meeting.START is None:
+        return (True, 0, 0)
+    return (False, meeting.START, meeting.END)
+
+
+# Sort key grouping courses by their days (earliest weekday first), then by meeting time within each group
+def schedule_order(course):
+    mask = course.meeting.DAYS
+    first_day = (mask & -mask).bit_length() if mask else len(DAY_CODES) + 1
+    return (first_day, mask) + time_order(course)
+
+
+# Formats minutes after midnight as a 12-hour clock time, e.g. 810 -> "1:30 PM"
+def format_minutes(minutes):
+    hours, minutes = divmod(minutes, 60)
+    period = 'AM' if hours < 12 else 'PM'
+    if hours > 12:
+        hours -= 12
+    return f"{hours}:{minutes:02d} {period}"
+
+
+# Prints course rows as a schedule: a heading for each set of meeting days, then its courses in time order
+def print_schedule(courses):
+    print("------ Schedule ------")
+
+    current_days = None
+    for course in sorted(courses, key=schedule_order):
+        meeting = course.meeting
+        if current_days != meeting.DAYS:
+            current_days = meeting.DAYS
+            print("\n" + ', '.join(DAY_NAMES[day] for day in mask_days(current_days)) + ":")
+
+        if meeting.START is None:
+            time = course.TIME
+        else:
+            time = f"{format_minutes(meeting.START)}-{format_minutes(meeting.END)}"
+        print(f"CRN: {course.CRN} | Course: {course.TITLE} | Time: {time}")
+
+    print("----------------------")
+
+
+# User parent class definition. The user classes use __slots__, so each user object stays small
 class user:
+    __slots__ = ('firstname', 'lastname', 'ID')
+
     def __init__(self, ID, f, l):
         self.firstname = f
         self.lastname = l
@@ -26,218 +1118,309 @@ class user:
         self.ID = i
 
 
-# Student class definition.
-class student(user):
-    def __init__(self, ID, firstname, lastname, expdgradyr, major, email):
-        super().__init__(ID, firstname, lastname)
-        self.expdgradyr = expdgradyr
-        self.major = major
-        self.email = email
-        self.schedule = []  # Schedule is a list of CRN's that can be added
+# Takes a seat in a section inside the caller's transaction. One conditional UPDATE both checks for and takes the
+# seat, so two sessions can never book the last seat twice. Returns False if the section is full; a section with no
+# capacity set never is
+def take_seat(crn):
+    cursor.execute("""UPDATE seats SET TAKEN = TAKEN + 1 WHERE CRN=? AND TAKEN < CAPACITY""", (crn,))
+    if cursor.rowcount:
+        return True
+    cursor.execute("""SELECT 1 FROM seats WHERE CRN=?""", (crn,))
+    return cursor.fetchone() is None
 
-    # Searches for course
-    def searchCourse(self):
-        # Opens up courses database
-        cursor.execute("PRAGMA table_info(courses)")
-        columns = cursor.fetchall()
-        # pulls the headers of each of the columns
-        column_names = [column[1] for column in columns]
-
-        # Prints out to the user column names that they can query by
-        print("Available columns for search:")
-        for i, column in enumerate(column_names, start=1):
-            print(f"{i}. {column}")
-
-        # Based on choice, it will query the user's choice and print all rows that meet the requirements.
-        choice = input("Enter the column number to search: ")
-        if choice.isdigit() and int(choice) in range(1, len(column_names) + 1):
-            column = column_names[int(choice) - 1]
-            value = input(f"Enter the value to search for in {column}: ")
-
-            cursor.execute(f"SELECT * FROM courses WHERE {column}=?", (value,))
-            results = cursor.fetchall()
-
-            if results:
-                print("Search Results:")
-                for row in results:
-                    print(row)
-            else:
-                print("No results found.")
-        else:
-            print("Invalid column choice.")
 
-    # Add drop course. Takes in ad. If ad == true, then it will add course, else it will drop.
-    def addDropCourse(self, ad):
-        crn = input("Enter the CRN of the course: ")
+# Returns the course rows a user is enrolled in that overlap the given course row, checked the same way
+# SchedulingService.add checks a loaded schedule
+def enrollment_conflicts(user_id, role, course):
+    cursor.execute("""SELECT CRN FROM enrollment WHERE USER_ID=? AND ROLE=?""", (user_id, role))
+    return build_schedule_index([row[0] for row in cursor.fetchall()]).conflicts(course)
 
-        cursor.execute("""SELECT * FROM courses WHERE CRN=?""", (crn,))
-        course_data = cursor.fetchone()
 
-        if course_data:
-            if ad and crn in self.schedule:
-                print("Course with CRN", crn, "is already in your schedule.")
-            elif not ad and crn not in self.schedule:
-                print("Course with CRN", crn, "is not in your schedule.")
-            else:
-                if ad:
-                    # Checks for conflicting courses in schedule
-                    conflicting_courses = []
-                    for scheduled_crn in self.schedule:
-                        cursor.execute("""SELECT * FROM courses WHERE CRN=?""", (scheduled_crn,))
-                        scheduled_course_data = cursor.fetchone()
-                        if scheduled_course_data[4] == course_data[4] and scheduled_course_data[5] == course_data[5]:
-                            conflicting_courses.append(scheduled_course_data)
-                    if conflicting_courses:
-                        print("The course conflicts with the following courses in your schedule:")
-                        for course in conflicting_courses:
-                            print(course)
-                    else:
-                        self.schedule.append(crn)
-                        print("Course with CRN", crn, "added to your schedule.")
-                else:
-                    self.schedule.remove(crn)
-                    print("Course with CRN", crn, "removed from your schedule.")
+# Enrolls the first student on a section's waitlist inside the caller's transaction, skipping anyone who enrolled
+# some other way meanwhile. Students the section would conflict with stay on the waitlist and are passed over.
+# Returns the student's ID, or None if nobody can be promoted
+def promote_waitlisted(crn):
+    course = course_cache.get(crn)
+    last_id = 0
+    while True:
+        cursor.execute("""SELECT ID, USER_ID FROM waitlist WHERE CRN=? AND ID > ? ORDER BY ID LIMIT 1""",
+                       (crn, last_id))
+        waiting = cursor.fetchone()
+        if waiting is None:
+            return None
+        last_id = waiting[0]
+        if course is not None and enrollment_conflicts(waiting[1], 'student', course):
+            continue
+        cursor.execute("""DELETE FROM waitlist WHERE ID=?""", (waiting[0],))
+        cursor.execute("""INSERT OR IGNORE INTO enrollment (USER_ID, ROLE, CRN, SEMESTER, YEAR)
+                          SELECT ?, 'student', CRN, SEMESTER, YEAR FROM courses WHERE CRN=?""", (waiting[1], crn))
+        if cursor.rowcount:
+            return waiting[1]
+
+
+# Gives up a student's seat in a section inside the caller's transaction. The seat passes straight to the first
+# student on the waitlist, or is freed if nobody is waiting. Returns the promoted student's ID, if any
+def release_seat(crn):
+    promoted = promote_waitlisted(crn)
+    if promoted is None:
+        cursor.execute("""UPDATE seats SET TAKEN = TAKEN - 1 WHERE CRN=? AND TAKEN > 0""", (crn,))
+    return promoted
+
+
+# A student's place on a section's waitlist, counting from 1, or None if they aren't on it
+def waitlist_position(crn, user_id):
+    cursor.execute("""SELECT COUNT(*) FROM waitlist
+                      WHERE CRN=? AND ID <= (SELECT ID FROM waitlist WHERE CRN=? AND USER_ID=?)""",
+                   (crn, crn, user_id))
+    return cursor.fetchone()[0] or None
+
+
+# Sets how many students a section holds, or removes the limit if capacity is None. Seats that open up go to the
+# waitlist in order. Raises ValueError if more students are already enrolled than the new capacity allows
+@timed('set_capacity')
+def set_capacity(crn, capacity):
+    with transaction():
+        begin('IMMEDIATE')
+        cursor.execute("""SELECT COUNT(*) FROM enrollment WHERE CRN=? AND ROLE='student'""", (crn,))
+        taken = cursor.fetchone()[0]
+        if capacity is None:
+            cursor.execute("""DELETE FROM seats WHERE CRN=?""", (crn,))
+            while promote_waitlisted(crn) is not None:
+                pass
+            return
+        if capacity < taken:
+            raise ValueError(f"{taken} students are already enrolled in CRN {crn}")
+        while taken < capacity and promote_waitlisted(crn) is not None:
+            taken += 1
+        cursor.execute("""INSERT INTO seats (CRN, CAPACITY, TAKEN) VALUES (?,?,?)
+                          ON CONFLICT (CRN) DO UPDATE SET CAPACITY=excluded.CAPACITY, TAKEN=excluded.TAKEN""",
+                       (crn, capacity, taken))
+
+
+# Handles the schedules of students and instructors: loading them, checking courses for conflicts, adding and
+# dropping courses and printing them. Both roles go through the one instance, so there is a single registration
+# path to tune and its counters cover every user
+class SchedulingService:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+
+    def count(self, event):
+        with self.lock:
+            self.counts[event] += 1
+
+    # Loads the CRN's a user is enrolled in from the enrollment table. An interval index already built for the user
+    # is kept, as index() rebuilds it only if the CRN's changed
+    @timed('load_schedule')
+    def load(self, member):
+        cursor.execute("""SELECT CRN FROM enrollment WHERE USER_ID=? AND ROLE=?""", (member.ID, member.role))
+        member.schedule = [crn_key(row[0]) for row in cursor.fetchall()]
+
+    # Returns the interval index of a user's schedule, loading it with one query if the schedule changed outside it
+    def index(self, member):
+        if member.schedule_index is None or member.schedule_index.scheduled != set(member.schedule):
+            member.schedule_index = build_schedule_index(member.schedule)
+            self.count('index_builds')
+        return member.schedule_index
+
+    # Returns the course rows of a user's schedule
+    def courses(self, member):
+        return list(course_cache.getMany(member.schedule).values())
+
+    # Adds a course to a user's schedule unless it conflicts with one already there. Returns the conflicting
+    # course rows, empty if the course was added. A student asking for a full section goes on its waitlist instead,
+    # and the course stays out of their schedule
+    @timed('add_course')
+    def add(self, member, crn, course):
+        conflicting_courses = self.index(member).conflicts(course)
+        if conflicting_courses:
+            self.count('conflicts')
+            return conflicting_courses
+        if self.reserve(member, crn, course):
+            member.schedule.append(crn)
+            member.schedule_index.add(course, crn)
+            self.count('adds')
         else:
-            print("Course with CRN", crn, "does not exist.")
-
-    # Prints the schedule of the user based on the CRN's in their schedule
-    def printSchedule(self):
-        print("------ Schedule ------")
+            self.count('waitlisted')
+        return []
+
+    # Enrolls a user in a section in one short write transaction. BEGIN IMMEDIATE takes the write lock up front, so
+    # concurrent sessions queue on busy_timeout instead of failing to upgrade a read lock. A user the enrollment
+    # table already has (promoted off the waitlist, or enrolled from another session) keeps the seat they hold.
+    # Other students need a seat; without one they are waitlisted. Returns whether the user is enrolled
+    def reserve(self, member, crn, course):
+        with transaction():
+            begin('IMMEDIATE')
+            cursor.execute("""SELECT 1 FROM enrollment WHERE USER_ID=? AND ROLE=? AND CRN=?""",
+                           (member.ID, member.role, crn))
+            if cursor.fetchone() is not None:
+                return True
+            if member.role == 'student' and not take_seat(crn):
+                cursor.execute("""INSERT OR IGNORE INTO waitlist (CRN, USER_ID) VALUES (?,?)""", (crn, member.ID))
+                return False
+            cursor.execute("""INSERT INTO enrollment (USER_ID, ROLE, CRN, SEMESTER, YEAR) VALUES (?,?,?,?,?)""",
+                           (member.ID, member.role, crn, course.SEMESTER, course.YEAR))
+        return True
+
+    # Drops a course from a user's schedule. A student's seat passes to the first student on the waitlist
+    @timed('drop_course')
+    def drop(self, member, crn):
+        with transaction():
+            begin('IMMEDIATE')
+            cursor.execute("""DELETE FROM enrollment WHERE USER_ID=? AND ROLE=? AND CRN=?""",
+                           (member.ID, member.role, crn))
+            if member.role == 'student' and cursor.rowcount and release_seat(crn) is not None:
+                self.count('promotions')
+        self.index(member).remove(crn)
+        member.schedule.remove(crn)
+        self.count('drops')
+
+    # Takes a user off a section's waitlist. Returns whether they were on it
+    def leaveWaitlist(self, member, crn):
+        with transaction():
+            cursor.execute("""DELETE FROM waitlist WHERE CRN=? AND USER_ID=?""", (crn, member.ID))
+            return cursor.rowcount > 0
+
+    # Asks for a CRN and adds it to (ad is True) or drops it from a user's schedule
+    def addDrop(self, member, ad):
+        crn = input("Enter the CRN of the course: ")
+        self.change(member, crn, ad)
 
-        cursor.execute("""SELECT * FROM courses WHERE CRN IN ({}) ORDER BY TIME""".format(','.join(self.schedule)))
-        scheduled_courses = cursor.fetchall()
+    # Adds a CRN to (ad is True) or drops it from a user's schedule, printing the outcome. Returns whether the
+    # schedule changed. The schedule is read again first, as another session or a waitlist promotion may have
+    # changed it since it was loaded
+    def change(self, member, crn, ad):
+        crn = crn_key(crn)
+        course_data = course_cache.get(crn)
+        self.load(member)
 
-        # Maps the days based on the database format to text format
-        day_mapping = {'M': 'Monday', 'T': 'Tuesday', 'W': 'Wednesday', 'R': 'Thursday', 'F': 'Friday'}
+        if not course_data:
+            print("Course with CRN", crn, "does not exist.")
+        elif ad and crn in member.schedule:
+            print("Course with CRN", crn, "is already in your schedule.")
+        elif not ad and crn not in member.schedule:
+            if member.role == 'student' and self.leaveWaitlist(member, crn):
+                print("Course with CRN", crn, "removed from your waitlist.")
+                return True
+            print("Course with CRN", crn, "is not in your schedule.")
+        elif ad:
+            conflicting_courses = self.add(member, crn, course_data)
+            if conflicting_courses:
+                print("The course conflicts with the following courses in your schedule:")
+                for course in conflicting_courses:
+                    print(course)
+            elif crn in member.schedule:
+                print("Course with CRN", crn, "added to your schedule.")
+                return True
+            else:
+                print(f"Course with CRN {crn} is full. You are number {waitlist_position(crn, member.ID)} on its waitlist.")
+        else:
+            self.drop(member, crn)
+            print("Course with CRN", crn, "removed from your schedule.")
+            return True
+        return False
 
-        sorted_courses = sorted(scheduled_courses, key=lambda x: x[3])
+    # Prints a user's schedule
+    @timed('print_schedule')
+    def render(self, member):
+        print_schedule(self.courses(member))
 
-        current_day = None
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
 
-        for course in sorted_courses:
-            crn, title, dept, time, days, semester, year, credits = course
 
-            day_codes = list(days)
-            start_time, end_time = time.split('-')
+scheduling = SchedulingService()
 
-            if current_day != day_codes:
-                current_day = day_codes
-                print("\n" + ', '.join(day_mapping[day] for day in current_day) + ":")
 
-            start_time = convert_time_format(start_time)
-            end_time = convert_time_format(end_time)
+# Parent class of the users that keep a schedule of courses. The schedule work itself is done by the scheduling
+# service
+class member(user):
+    __slots__ = ('schedule', 'schedule_index')
+    role = None
 
-            print(f"CRN: {crn} | Course: {title} | Time: {start_time}-{end_time}")
+    def __init__(self, ID, firstname, lastname):
+        super().__init__(ID, firstname, lastname)
+        self.schedule = []  # Schedule is a list of CRN's that can be added
+        self.schedule_index = None  # Meeting times of the schedule, built on first add/drop
 
-        print("----------------------")
+    def loadSchedule(self):
+        scheduling.load(self)
 
+    # Searches for courses with any combination of filters
+    def searchCourse(self):
+        search_course_prompt()
 
-class instructor(user):
-    def __init__(self, ID, firstname, lastname, title, yearofhire, department, email):
-        super().__init__(ID, firstname, lastname)
-        self.title = title
-        self.yearofhire = yearofhire
-        self.department = department
-        self.email = email
-        self.schedule = []
+    # Add drop course. Takes in ad. If ad == true, then it will add course, else it will drop.
+    def addDropCourse(self, ad):
+        scheduling.addDrop(self, ad)
 
     # Prints the schedule of the user based on the CRN's in their schedule
     def printSchedule(self):
-        print("------ Schedule ------")
-
-        cursor.execute("""SELECT * FROM courses WHERE CRN IN ({}) ORDER BY TIME""".format(','.join(self.schedule)))
-        scheduled_courses = cursor.fetchall()
+        scheduling.render(self)
 
-        day_mapping = {'M': 'Monday', 'T': 'Tuesday', 'W': 'Wednesday', 'R': 'Thursday', 'F': 'Friday'}
 
-        sorted_courses = sorted(scheduled_courses, key=lambda x: x[3])
-
-        current_day = None
-
-        for course in sorted_courses:
-            crn, title, dept, time, days, semester, year, credits = course
-
-            day_codes = list(days)
-            start_time, end_time = time.split('-')
+# Student class definition.
+class student(member):
+    __slots__ = ('expdgradyr', 'major', 'email')
+    role = 'student'
 
-            if current_day != day_codes:
-                current_day = day_codes
-                print("\n" + ', '.join(day_mapping[day] for day in current_day) + ":")
+    def __init__(self, ID, firstname, lastname, expdgradyr, major, email):
+        super().__init__(ID, firstname, lastname)
+        self.expdgradyr = expdgradyr
+        self.major = major
+        self.email = email
 
-            start_time = convert_time_format(start_time)
-            end_time = convert_time_format(end_time)
 
-            print(f"CRN: {crn} | Course: {title} | Time: {start_time}-{end_time}")
+class instructor(member):
+    __slots__ = ('title', 'yearofhire', 'department', 'email')
+    role = 'instructor'
 
-        print("----------------------")
+    def __init__(self, ID, firstname, lastname, title, yearofhire, department, email):
+        super().__init__(ID, firstname, lastname)
+        self.title = title
+        self.yearofhire = yearofhire
+        self.department = department
+        self.email = email
 
-    # Not implemented/added
+    # Prints the students enrolled in each section this instructor teaches. One join covers every section, using
+    # the enrollment CRN index and the student primary key, and rows are written out a batch at a time
+    @timed('print_class_list')
     def printClassList(self):
-        print("Printed out your class list! Kinda...")
-
-    # searches for courses in database (same as student)
-    def searchCourse(self):
-        cursor.execute("PRAGMA table_info(courses)")
-        columns = cursor.fetchall()
-        column_names = [column[1] for column in columns]
-
-        print("Available columns for search:")
-        for i, column in enumerate(column_names, start=1):
-            print(f"{i}. {column}")
-
-        choice = input("Enter the column number to search: ")
-        if choice.isdigit() and int(choice) in range(1, len(column_names) + 1):
-            column = column_names[int(choice) - 1]
-            value = input(f"Enter the value to search for in {column}: ")
-
-            cursor.execute(f"SELECT * FROM courses WHERE {column}=?", (value,))
-            results = cursor.fetchall()
-
-            if results:
-                print("Search Results:")
-                for row in results:
-                    print(row)
-            else:
-                print("No results found.")
-        else:
-            print("Invalid column choice.")
-
-    # Adds/Drops course (same as student)
-    def addDropCourse(self, ad):
-        crn = input("Enter the CRN of the course: ")
-        cursor.execute("""SELECT * FROM courses WHERE CRN=?""", (crn,))
-        course_data = cursor.fetchone()
-
-        if course_data:
-            if ad and crn in self.schedule:
-                print("Course with CRN", crn, "is already in your schedule.")
-            elif not ad and crn not in self.schedule:
-                print("Course with CRN", crn, "is not in your schedule.")
-            else:
-                if ad:
-                    conflicting_courses = []
-                    for scheduled_crn in self.schedule:
-                        cursor.execute("""SELECT * FROM courses WHERE CRN=?""", (scheduled_crn,))
-                        scheduled_course_data = cursor.fetchone()
-
-                        if scheduled_course_data[4] == course_data[4] and scheduled_course_data[5] == course_data[5]:
-                            conflicting_courses.append(scheduled_course_data)
-
-                    if conflicting_courses:
-                        print("The course conflicts with the following courses in your schedule:")
-                        for course in conflicting_courses:
-                            print(course)
-                    else:
-                        self.schedule.append(crn)
-                        print("Course with CRN", crn, "added to your schedule.")
+        print("------ Class List ------")
+        cursor.execute("""SELECT taught.CRN, courses.TITLE, student.ID, student.NAME, student.SURNAME, student.MAJOR,
+                                 student.EMAIL
+                          FROM enrollment AS taught
+                          LEFT JOIN courses ON courses.CRN = taught.CRN
+                          LEFT JOIN enrollment AS enrolled ON enrolled.CRN = taught.CRN AND enrolled.ROLE = 'student'
+                          LEFT JOIN student ON student.ID = enrolled.USER_ID
+                          WHERE taught.USER_ID=? AND taught.ROLE='instructor'
+                          ORDER BY taught.CRN, student.SURNAME, student.NAME""", (self.ID,))
+
+        current_crn = None
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            lines = []
+            for crn, title, student_id, *student_info in rows:
+                if crn != current_crn:
+                    current_crn = crn
+                    lines.append(f"\nCRN: {crn} | Course: {title}")
+                if student_id is None:
+                    lines.append("No students enrolled.")
                 else:
-                    self.schedule.remove(crn)
-                    print("Course with CRN", crn, "removed from your schedule.")
-        else:
-            print("Course with CRN", crn, "does not exist.")
+                    lines.append(format_fields((student_id, *student_info)))
+            sys.stdout.write(''.join(line + '\n' for line in lines))
+
+        if current_crn is None:
+            print("You are not teaching any courses.")
+        print("----------------------")
 
 
 class Admin(user):
+    __slots__ = ('title', 'office', 'email')
+
     def __init__(self, ID, firstname, lastname, title, office, email):
         super().__init__(ID, firstname, lastname)
         self.title = title
@@ -292,17 +1475,26 @@ class Admin(user):
             if admin_check or instructor_check or student_check:
                 confirm = input(f"Are you sure you want to remove user ID: {removeid}? (Yes/No): ")
                 if confirm == "Yes":
+                    with transaction():
+                        if admin_check:
+                            cursor.execute("""DELETE FROM admin WHERE ID=?""", (removeid,))
+                        if instructor_check:
+                            cursor.execute("""DELETE FROM enrollment WHERE USER_ID=? AND ROLE='instructor'""", (removeid,))
+                            cursor.execute("""DELETE FROM instructor WHERE ID=?""", (removeid,))
+                        if student_check:
+                            begin('IMMEDIATE')
+                            cursor.execute("""SELECT CRN FROM enrollment WHERE USER_ID=? AND ROLE='student'""", (removeid,))
+                            enrolled_crns = [row[0] for row in cursor.fetchall()]
+                            cursor.execute("""DELETE FROM enrollment WHERE USER_ID=? AND ROLE='student'""", (removeid,))
+                            for crn in enrolled_crns:
+                                release_seat(crn)
+                            cursor.execute("""DELETE FROM waitlist WHERE USER_ID=?""", (removeid,))
+                            cursor.execute("""DELETE FROM student WHERE ID=?""", (removeid,))
                     if admin_check:
-                        cursor.execute("""DELETE FROM admin WHERE ID=?""", (removeid,))
-                        db.commit()
                         print("User removed from the admin table.")
                     if instructor_check:
-                        cursor.execute("""DELETE FROM instructor WHERE ID=?""", (removeid,))
-                        db.commit()
                         print("User removed from the instructor table.")
                     if student_check:
-                        cursor.execute("""DELETE FROM student WHERE ID=?""", (removeid,))
-                        db.commit()
                         print("User removed from the student table.")
                 else:
                     print("Canceling user removal...")
@@ -313,7 +1505,10 @@ class Admin(user):
     def addRemoveCourse(self, ar):
         if ar:
             print("Please enter the following information")
-            crn = input("CRN: ")
+            crn = crn_key(input("CRN: "))
+            if not (crn.isascii() and crn.isdigit()):
+                print("Error: CRN", crn, "is not a number.")
+                return
             title = input("Title: ")
             department = input("Department: ")
             time = input("Time: ")
@@ -327,223 +1522,211 @@ class Admin(user):
             if existing_crn:
                 print("Error: Course with CRN ", crn, "already exists.")
             else:
-                cursor.execute(
-                    """INSERT INTO courses (CRN, TITLE, DEPT, TIME, DAYS, SEMESTER, YEAR, CREDITS) VALUES (?,?,?,?,?,?,?,?)""",
-                    (crn, title, department, time, days, semester, year, creditnum))
-                db.commit()
+                with transaction():
+                    cursor.execute(
+                        """INSERT INTO courses (CRN, TITLE, DEPT, TIME, DAYS, SEMESTER, YEAR, CREDITS) VALUES (?,?,?,?,?,?,?,?)""",
+                        (crn, title, department, time, days, semester, year, creditnum))
+                course_cache.invalidate(crn)
         else:
             print("Course Removal - Please enter the following information")
             removecrn = input("Course CRN: ")
-            cursor.execute("""SELECT ID FROM courses WHERE ID=?""", (removecrn,))
+            cursor.execute("""SELECT CRN FROM courses WHERE CRN=?""", (removecrn,))
             courses_check = cursor.fetchone()
             if courses_check:
-                confirm = input(f"Are you sure you want ro remove CRN: {removecrn}? (Yes/No): ")
+                confirm = input(f"Are you sure you want to remove CRN: {removecrn}? (Yes/No): ")
                 if confirm == "Yes":
-                    cursor.execute("""DELETE FROM courses WHERE CRN=?""", (removecrn,))
-                    db.commit()
+                    with transaction():
+                        cursor.execute("""DELETE FROM enrollment WHERE CRN=?""", (removecrn,))
+                        cursor.execute("""DELETE FROM waitlist WHERE CRN=?""", (removecrn,))
+                        cursor.execute("""DELETE FROM seats WHERE CRN=?""", (removecrn,))
+                        cursor.execute("""DELETE FROM courses WHERE CRN=?""", (removecrn,))
+                    course_cache.invalidate(removecrn)
                     print("Course removed from the courses table.")
                 elif confirm == "No":
                     print("Exiting...")
                 else:
                     print("Invalid input!")
 
-    # prints all courses
-    def printRoster(self):
-        cursor.execute("""SELECT * FROM courses""")
-        course_info = cursor.fetchall()
+    # Sets how many students a course section holds, or removes the limit
+    def setCourseCapacity(self):
+        crn = input("Course CRN: ")
+        if course_cache.get(crn) is None:
+            print("Course with CRN", crn, "does not exist.")
+            return
+        capacity = input("Capacity (leave blank for no limit): ")
+        if capacity and not capacity.isdigit():
+            print("Capacity must be a whole number.")
+            return
+        try:
+            set_capacity(crn, int(capacity) if capacity else None)
+        except ValueError as error:
+            print("Error:", error)
+            return
+        print("Capacity of CRN", crn, "updated.")
+
+    # Loads students, instructors or courses from a CSV or JSONL file
+    def bulkImport(self):
+        table = input("Import into which table? (student, instructor, courses): ")
+        if table not in IMPORT_COLUMNS:
+            print("Invalid Input!")
+            return
+        path = input("Path to .csv or .jsonl file: ")
+        if table == 'courses':
+            create_courses_table()
+        try:
+            report = import_file(table, path)
+        except OSError as error:
+            print("Error: could not read", path, "-", error)
+            return
+        report.printReport()
+
+    # Writes a table out to a CSV, JSONL or columnar (.rcol) file
+    def bulkExport(self):
+        table = input("Export which table? (courses, student, instructor, admin): ")
+        if table not in EXPORT_FILTERS:
+            print("Invalid Input!")
+            return
+        path = input("Path to .csv, .jsonl or .rcol file: ")
+        filters = {}
+        for name in EXPORT_FILTERS[table]:
+            value = input(f"Only export {name} (leave blank for all): ")
+            if value:
+                filters[name] = value
+        try:
+            count = export_table(table, path, filters)
+        except (OSError, ValueError) as error:
+            print("Error:", error)
+            return
+        print(f"Exported {count} row(s) from {table} to {path}.")
+
+    # prints all courses, streamed or page_size rows at a time
+    def printRoster(self, page_size=None):
         print("----- Courses -----")
-        for row in course_info:
-            print(row)
+        print_rows("""SELECT * FROM courses""", page_size=page_size, operation='print_roster')
 
-    # modify user based on selected ID
+    # modify users based on selected ID. Edits to any number of fields and users are staged, then written together
+    # in one transaction
     def modifyUser(self):
-        print("Enter the ID of the user that you would like to edit")
-        editID = input("ID Number: ")
-        cursor.execute("""SELECT ID FROM admin WHERE ID=?""", (editID,))
-        admin_check = cursor.fetchone()
-        cursor.execute("""SELECT ID FROM instructor WHERE ID=?""", (editID,))
-        instructor_check = cursor.fetchone()
-        cursor.execute("""SELECT ID FROM student WHERE ID=?""", (editID,))
-        student_check = cursor.fetchone()
-        if admin_check or instructor_check or student_check:
-            print("Enter the attribute you would like to edit")
+        edits = UserEdits()
+        while True:
+            print("Enter the ID of the user that you would like to edit")
+            editID = input("ID Number: ")
+            cursor.execute("""SELECT ID FROM admin WHERE ID=?""", (editID,))
+            admin_check = cursor.fetchone()
+            cursor.execute("""SELECT ID FROM instructor WHERE ID=?""", (editID,))
+            instructor_check = cursor.fetchone()
+            cursor.execute("""SELECT ID FROM student WHERE ID=?""", (editID,))
+            student_check = cursor.fetchone()
             if admin_check:
-                print("1. ID Number")
-                print("2. First Name")
-                print("3. Last Name")
-                print("4. Title")
-                print("5. Office")
-                print("6. Email")
-                print("7. Exit")
-                choice = input("Please enter your choice (1-7): ")
-                match choice:
-                    case "1":
-                        newID = input("Please enter a new ID number: ")
-                        cursor.execute("""UPDATE admin SET ID = ? WHERE ID = ?""", (newID, editID,))
-                        db.commit()
-                    case "2":
-                        newFN = input("Please enter a new First name: ")
-                        cursor.execute("""UPDATE admin SET NAME = ? WHERE ID = ?""", (newFN, editID,))
-                        db.commit()
-                    case "3":
-                        newLN = input("Please enter a new Last name: ")
-                        cursor.execute("""UPDATE admin SET SURNAME = ? WHERE ID = ?""", (newLN, editID,))
-                        db.commit()
-                    case "4":
-                        newTitle = input("Please enter a new Title: ")
-                        cursor.execute("""UPDATE admin SET TITLE = ? WHERE ID = ?""", (newTitle, editID,))
-                        db.commit()
-                    case "5":
-                        newOffice = input("Please enter a new Office: ")
-                        cursor.execute("""UPDATE admin SET OFFICE = ? WHERE ID = ?""", (newOffice, editID,))
-                        db.commit()
-                    case "6":
-                        newEmail = input("Please enter a new Email: ")
-                        cursor.execute("""UPDATE admin SET EMAIL = ? WHERE ID = ?""", (newEmail, editID,))
-                        db.commit()
-                    case "7":
-                        print("Exiting...")
-                    case _:
-                        print("Invalid input!")
+                self.stageUserEdits(edits, 'admin', editID)
             elif instructor_check:
-                print("1. ID Number")
-                print("2. First Name")
-                print("3. Last Name")
-                print("4. Title")
-                print("5. Year of Hire")
-                print("6. Department")
-                print("7. Email")
-                print("8. Exit")
-                choice = input("Please enter your choice (1-8): ")
-                match choice:
-                    case "1":
-                        newID = input("Please enter a new ID number: ")
-                        cursor.execute("""UPDATE instructor SET ID = ? WHERE ID = ?""", (newID, editID,))
-                        db.commit()
-                    case "2":
-                        newFN = input("Please enter a new First name: ")
-                        cursor.execute("""UPDATE instructor SET NAME = ? WHERE ID = ?""", (newFN, editID,))
-                        db.commit()
-                    case "3":
-                        newLN = input("Please enter a new Last name: ")
-                        cursor.execute("""UPDATE instructor SET SURNAME = ? WHERE ID = ?""", (newLN, editID,))
-                        db.commit()
-                    case "4":
-                        newTitle = input("Please enter a new Title: ")
-                        cursor.execute("""UPDATE instructor SET TITLE = ? WHERE ID = ?""", (newTitle, editID,))
-                        db.commit()
-                    case "5":
-                        newHRYR = input("Please enter a new hire year: ")
-                        cursor.execute("""UPDATE instructor SET HIREYR = ? WHERE ID = ?""", (newHRYR, editID,))
-                        db.commit()
-                    case "6":
-                        newDEPT = input("Please enter a new Department: ")
-                        cursor.execute("""UPDATE instructor SET DEPT = ? WHERE ID = ?""", (newDEPT, editID,))
-                        db.commit()
-                    case "7":
-                        newEmail = input("Please enter a new Email: ")
-                        cursor.execute("""UPDATE instructor SET EMAIL = ? WHERE ID = ?""", (newEmail, editID,))
-                        db.commit()
-                    case "8":
-                        print("Exiting...")
-                    case _:
-                        print("Invalid input!")
-
+                self.stageUserEdits(edits, 'instructor', editID)
             elif student_check:
-                print("1. ID Number")
-                print("2. First Name")
-                print("3. Last Name")
-                print("4. Expected Graduation Year")
-                print("5. Major")
-                print("6. Email")
-                print("7. Exit")
-                choice = input("Please enter your choice (1-7): ")
-                match choice:
-                    case "1":
-                        newID = input("Please enter a new ID number: ")
-                        cursor.execute("""UPDATE student SET ID = ? WHERE ID = ?""", (newID, editID,))
-                        db.commit()
-                    case "2":
-                        newFN = input("Please enter a new First name: ")
-                        cursor.execute("""UPDATE student SET NAME = ? WHERE ID = ?""", (newFN, editID,))
-                        db.commit()
-                    case "3":
-                        newLN = input("Please enter a new Last name: ")
-                        cursor.execute("""UPDATE student SET SURNAME = ? WHERE ID = ?""", (newLN, editID,))
-                        db.commit()
-                    case "4":
-                        newGRADYR = input("Please enter a new Graduation year: ")
-                        cursor.execute("""UPDATE student SET GRADYEAR = ? WHERE ID = ?""", (newGRADYR, editID,))
-                        db.commit()
-                    case "5":
-                        newMajor = input("Please enter a new Major: ")
-                        cursor.execute("""UPDATE student SET MAJOR = ? WHERE ID = ?""", (newMajor, editID,))
-                        db.commit()
-                    case "6":
-                        newEmail = input("Please enter a new Email: ")
-                        cursor.execute("""UPDATE student SET EMAIL = ? WHERE ID = ?""", (newEmail, editID,))
-                        db.commit()
-                    case "7":
-                        print("Exiting...")
-                    case _:
-                        print("Invalid input!")
-
-
-# function to add admin's to a list of objets
-def add_admin():
-    admin_list = []
-    cursor.execute("""SELECT * FROM admin""")
-    all_admin_info = cursor.fetchall()
-
-    for admin_info in all_admin_info:
-        ID, first_name, last_name, title, office, email = admin_info
-        existing_admin = next((Admin for Admin in admin_list if Admin.ID == ID), None)
-        if existing_admin:
-            continue
-
-        newadmin = Admin(ID, first_name, last_name, title, office, email)
-        admin_list.append(newadmin)
-
-    return admin_list
-
-
-# function to add students's to a list of objets
-def add_student():
-    student_list = []
-    cursor.execute("""SELECT * FROM student""")
-    all_student_info = cursor.fetchall()
-
-    for student_info in all_student_info:
-        ID, first_name, last_name, expectedgradyear, major, email = student_info
-        existing_student = next((student for student in student_list if student.ID == ID), None)
-        if existing_student:
-            continue
-
-        newstudent = student(ID, first_name, last_name, expectedgradyear, major, email)
-        student_list.append(newstudent)
-
-    return student_list
-
-
-# function to add instructors's to a list of objets
-def add_instructor():
-    instructor_list = []
-    cursor.execute("""SELECT * FROM instructor""")
-    all_instructor_info = cursor.fetchall()
-
-    for instructor_info in all_instructor_info:
-        ID, first_name, last_name, title, yearofhire, department, email = instructor_info
-        existing_instructor = next((instructor for instructor in instructor_list if instructor.ID == ID), None)
-        if existing_instructor:
-            continue
+                self.stageUserEdits(edits, 'student', editID)
+            else:
+                print("User not found in the database")
 
-        newinstructor = instructor(ID, first_name, last_name, title, yearofhire, department, email)
-        instructor_list.append(newinstructor)
+            if input("Would you like to edit another user? (Yes/No): ") != "Yes":
+                break
+
+        if len(edits) == 0:
+            return
+        confirm = input(f"Save {len(edits)} change(s)? (Yes/No): ")
+        if confirm == "Yes":
+            try:
+                edits.commit()
+                print("Changes saved.")
+            except sqlite3.Error as error:
+                print("Error: no changes were saved -", error)
+        else:
+            edits.discard()
+            print("Discarding changes...")
 
-    return instructor_list
+    # Prompts for field edits on one user until they pick Exit, staging each one
+    def stageUserEdits(self, edits, table, editID):
+        fields = USER_FIELDS[table]
+        while True:
+            print("Enter the attribute you would like to edit")
+            for i, (label, column, prompt) in enumerate(fields, start=1):
+                print(f"{i}. {label}")
+            print(f"{len(fields) + 1}. Exit")
+            choice = input(f"Please enter your choice (1-{len(fields) + 1}): ")
+            if choice.isdigit() and 1 <= int(choice) <= len(fields):
+                label, column, prompt = fields[int(choice) - 1]
+                edits.stage(table, editID, column, input(prompt))
+            elif choice == str(len(fields) + 1):
+                print("Exiting...")
+                return
+            else:
+                print("Invalid input!")
+
+
+# Editable columns of each user table as (menu label, column, prompt), in the order modifyUser lists them
+USER_FIELDS = {
+    'admin': (
+        ("ID Number", "ID", "Please enter a new ID number: "),
+        ("First Name", "NAME", "Please enter a new First name: "),
+        ("Last Name", "SURNAME", "Please enter a new Last name: "),
+        ("Title", "TITLE", "Please enter a new Title: "),
+        ("Office", "OFFICE", "Please enter a new Office: "),
+        ("Email", "EMAIL", "Please enter a new Email: "),
+    ),
+    'instructor': (
+        ("ID Number", "ID", "Please enter a new ID number: "),
+        ("First Name", "NAME", "Please enter a new First name: "),
+        ("Last Name", "SURNAME", "Please enter a new Last name: "),
+        ("Title", "TITLE", "Please enter a new Title: "),
+        ("Year of Hire", "HIREYEAR", "Please enter a new hire year: "),
+        ("Department", "DEPT", "Please enter a new Department: "),
+        ("Email", "EMAIL", "Please enter a new Email: "),
+    ),
+    'student': (
+        ("ID Number", "ID", "Please enter a new ID number: "),
+        ("First Name", "NAME", "Please enter a new First name: "),
+        ("Last Name", "SURNAME", "Please enter a new Last name: "),
+        ("Expected Graduation Year", "GRADYEAR", "Please enter a new Graduation year: "),
+        ("Major", "MAJOR", "Please enter a new Major: "),
+        ("Email", "EMAIL", "Please enter a new Email: "),
+    ),
+}
+
+
+# Unit of work for user edits. Field changes are staged per user and written with one UPDATE per user, all inside
+# a single transaction, so a batch of corrections costs one commit and is all-or-nothing
+class UserEdits:
+    def __init__(self):
+        self.changes = {}  # (table, ID) -> {column: new value}
+
+    def stage(self, table, ID, column, value):
+        self.changes.setdefault((table, ID), {})[column] = value
+
+    def discard(self):
+        self.changes.clear()
+
+    @timed('update_users')
+    def commit(self):
+        with transaction():
+            for (table, ID), columns in self.changes.items():
+                assignments = ', '.join(f"{column} = ?" for column in columns)
+                cursor.execute(f"""UPDATE {table} SET {assignments} WHERE ID = ?""", (*columns.values(), ID))
+                if 'ID' in columns and table in ('student', 'instructor'):
+                    self.moveEnrollment(table, ID, columns['ID'])
+        self.changes.clear()
+
+    # Carries a student's or instructor's enrollments, and a student's waitlist places, over to their new ID
+    @staticmethod
+    def moveEnrollment(role, old_id, new_id):
+        cursor.execute("""UPDATE enrollment SET USER_ID=? WHERE USER_ID=? AND ROLE=?""", (new_id, old_id, role))
+        if role == 'student':
+            cursor.execute("""UPDATE waitlist SET USER_ID=? WHERE USER_ID=?""", (new_id, old_id))
+
+    # Number of staged field changes
+    def __len__(self):
+        return sum(len(columns) for columns in self.changes.values())
 
 
 # Adds a new admin to the database
+@timed('add_user')
 def new_admin(ID, firstname, lastname, title, office, email):
     cursor.execute("""SELECT ID FROM admin WHERE ID=?""", (ID,))
     existing_id = cursor.fetchone()
@@ -551,12 +1734,16 @@ def new_admin(ID, firstname, lastname, title, office, email):
     if existing_id:
         print("Error: User with ID", ID, "already exists.")
     else:
-        cursor.execute("""INSERT INTO admin (ID, NAME, SURNAME, TITLE, OFFICE, EMAIL) VALUES (?,?,?,?,?,?)""",
-                       (ID, firstname, lastname, title, office, email))
-        db.all
+        try:
+            with transaction():
+                cursor.execute("""INSERT INTO admin (ID, NAME, SURNAME, TITLE, OFFICE, EMAIL) VALUES (?,?,?,?,?,?)""",
+                               (ID, firstname, lastname, title, office, email))
+        except sqlite3.IntegrityError:
+            print("Error: User with email", email, "already exists.")
 
 
 # Adds a new instructor to the database
+@timed('add_user')
 def new_instructor(ID, first_name, last_name, title, yearofhire, department, email):
     cursor.execute("""SELECT ID FROM instructor WHERE ID=?""", (ID,))
     existing_id = cursor.fetchone()
@@ -564,13 +1751,17 @@ def new_instructor(ID, first_name, last_name, title, yearofhire, department, ema
     if existing_id:
         print("Error: User with ID", ID, "already exists.")
     else:
-        cursor.execute(
-            """INSERT INTO instructor (ID, NAME, SURNAME, TITLE, HIREYR, DEPT, EMAIL) VALUES (?,?,?,?,?,?,?)""",
-            (ID, first_name, last_name, title, yearofhire, department, email))
-        db.commit()
+        try:
+            with transaction():
+                cursor.execute(
+                    """INSERT INTO instructor (ID, NAME, SURNAME, TITLE, HIREYEAR, DEPT, EMAIL) VALUES (?,?,?,?,?,?,?)""",
+                    (ID, first_name, last_name, title, yearofhire, department, email))
+        except sqlite3.IntegrityError:
+            print("Error: User with email", email, "already exists.")
 
 
 # Adds a new student to the database
+@timed('add_user')
 def new_student(ID, first_name, last_name, expectedgradyear, major, email):
     cursor.execute("""SELECT ID FROM student WHERE ID=?""", (ID,))
     existing_id = cursor.fetchone()
@@ -578,47 +1769,263 @@ def new_student(ID, first_name, last_name, expectedgradyear, major, email):
     if existing_id:
         print("Error: User with ID", ID, "already exists.")
     else:
-        cursor.execute("""INSERT INTO student (ID, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL) VALUES (?,?,?,?,?,?)""",
-                       (ID, first_name, last_name, expectedgradyear, major, email))
-        db.commit()
-
-
-# Print's the database at start of program
-def print_database():
-    admin_objects = add_admin()
-    student_objects = add_student()
-    instructor_object = add_instructor()
-
+        try:
+            with transaction():
+                cursor.execute("""INSERT INTO student (ID, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL) VALUES (?,?,?,?,?,?)""",
+                               (ID, first_name, last_name, expectedgradyear, major, email))
+        except sqlite3.IntegrityError:
+            print("Error: User with email", email, "already exists.")
+
+
+# Columns that bulk imports fill for each table, in table order. Rows upsert on the first column
+IMPORT_COLUMNS = {
+    'student': ('ID', 'NAME', 'SURNAME', 'GRADYEAR', 'MAJOR', 'EMAIL'),
+    'instructor': ('ID', 'NAME', 'SURNAME', 'TITLE', 'HIREYEAR', 'DEPT', 'EMAIL'),
+    'courses': ('CRN', 'TITLE', 'DEPT', 'TIME', 'DAYS', 'SEMESTER', 'YEAR', 'CREDITS'),
+}
+
+# Rows written per transaction by a bulk import
+IMPORT_CHUNK_SIZE = 1000
+
+
+# Result of a bulk import: how many rows were written and the (line number, reason) of every row that wasn't
+class ImportReport:
+    def __init__(self, table):
+        self.table = table
+        self.imported = 0
+        self.errors = []
+
+    def printReport(self):
+        print(f"Imported {self.imported} row(s) into {self.table}.")
+        for line_number, reason in self.errors:
+            print(f"Line {line_number}: {reason}")
+
+
+# Yields (line number, row, error) for each record of a .jsonl file (one object per line) or a .csv file with a
+# header row. Column names are matched case-insensitively
+def read_import_rows(path):
+    with open(path, newline='') as file:
+        if path.lower().endswith('.jsonl'):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    yield line_number, None, f"invalid JSON ({error})"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, "expected a JSON object"
+                    continue
+                yield line_number, {str(key).strip().upper(): value for key, value in row.items()}, None
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, {str(key).strip().upper(): value for key, value in row.items()}, None
+
+
+# Picks a row's values out in column order. Returns (values, None), or (None, reason) if columns are missing
+def import_values(row, columns):
+    missing = [column for column in columns if row.get(column) in (None, '')]
+    if missing:
+        return None, "missing " + ', '.join(missing)
+    return tuple(row[column] for column in columns), None
+
+
+# Writes one chunk of rows in a single transaction with executemany. Existing rows with the same key are replaced.
+# If the chunk fails, it is replayed a row at a time under savepoints so only the bad rows are left out and reported
+def write_import_chunk(table, columns, chunk, report):
+    delete = f"DELETE FROM {table} WHERE {columns[0]}=?"
+    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+    try:
+        with transaction():
+            cursor.executemany(delete, [values[:1] for line_number, values in chunk])
+            cursor.executemany(insert, [values for line_number, values in chunk])
+        report.imported += len(chunk)
+    except sqlite3.Error:
+        with transaction():
+            begin()
+            for line_number, values in chunk:
+                cursor.execute("SAVEPOINT import_row")
+                try:
+                    cursor.execute(delete, values[:1])
+                    cursor.execute(insert, values)
+                    report.imported += 1
+                except sqlite3.Error as error:
+                    cursor.execute("ROLLBACK TO import_row")
+                    report.errors.append((line_number, str(error)))
+                cursor.execute("RELEASE import_row")
+
+
+# Streams a CSV or JSONL file into student, instructor or courses in chunks of chunk_size rows, upserting on ID/CRN
+@timed('import')
+def import_file(table, path, chunk_size=IMPORT_CHUNK_SIZE):
+    columns = IMPORT_COLUMNS[table]
+    report = ImportReport(table)
+    chunk = []
+    try:
+        for line_number, row, error in read_import_rows(path):
+            if error is None:
+                values, error = import_values(row, columns)
+            if error:
+                report.errors.append((line_number, error))
+                continue
+            chunk.append((line_number, values))
+            if len(chunk) >= chunk_size:
+                write_import_chunk(table, columns, chunk, report)
+                chunk = []
+        if chunk:
+            write_import_chunk(table, columns, chunk, report)
+    finally:
+        if table == 'courses':
+            course_cache.invalidate()
+    return report
+
+
+# Tables that can be exported, and the filters each of them supports as {filter: column}
+EXPORT_FILTERS = {
+    'courses': {'semester': 'SEMESTER', 'dept': 'DEPT'},
+    'student': {},
+    'instructor': {'dept': 'DEPT'},
+    'admin': {},
+}
+
+# File extension of each export format
+EXPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.rcol': 'columnar'}
+
+# Marks the start and end of a columnar export file
+COLUMNAR_MAGIC = b'RCOL1'
+
+
+# Writes batches of rows to a CSV file with a header row
+def write_csv(path, columns, batches):
+    count = 0
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+# Writes batches of rows to a JSONL file, one object per row
+def write_jsonl(path, columns, batches):
+    count = 0
+    with open(path, 'w') as file:
+        for rows in batches:
+            file.write(''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows))
+            count += len(rows)
+    return count
+
+
+# Writes batches of rows to a compact columnar file. Each batch becomes a row group in which every column is stored
+# as its own zlib-compressed JSON array, and a JSON footer at the end records the columns and where each row group
+# starts, so a reader can pull one row group at a time
+def write_columnar(path, columns, batches):
+    row_groups = []
+    count = 0
+    with open(path, 'wb') as file:
+        file.write(COLUMNAR_MAGIC)
+        for rows in batches:
+            row_groups.append((file.tell(), len(rows)))
+            for column_values in zip(*rows):
+                data = zlib.compress(json.dumps(column_values, separators=(',', ':')).encode())
+                file.write(struct.pack('<I', len(data)))
+                file.write(data)
+            count += len(rows)
+        footer = json.dumps({'columns': list(columns), 'row_groups': row_groups}).encode()
+        file.write(footer)
+        file.write(struct.pack('<I', len(footer)))
+        file.write(COLUMNAR_MAGIC)
+    return count
+
+
+# Reads a file written by write_columnar, yielding each row as a dict one row group at a time
+def read_columnar(path):
+    with open(path, 'rb') as file:
+        trailer = len(COLUMNAR_MAGIC) + 4
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar export")
+        file.seek(-trailer, os.SEEK_END)
+        footer_length = struct.unpack('<I', file.read(4))[0]
+        if file.read() != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a complete columnar export")
+        file.seek(-trailer - footer_length, os.SEEK_END)
+        footer = json.loads(file.read(footer_length))
+
+        columns = footer['columns']
+        for offset, row_count in footer['row_groups']:
+            file.seek(offset)
+            column_values = []
+            for column in columns:
+                length = struct.unpack('<I', file.read(4))[0]
+                column_values.append(json.loads(zlib.decompress(file.read(length))))
+            for row in zip(*column_values):
+                yield dict(zip(columns, row))
+
+
+EXPORT_WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'columnar': write_columnar}
+
+
+# Streams a table to a .csv, .jsonl or .rcol (columnar) file in fetchmany batches, so memory use doesn't grow with
+# the table. filters maps the names in EXPORT_FILTERS to the value to match, e.g. {'semester': 'Summer'}. Returns
+# the number of rows written
+@timed('export')
+def export_table(table, path, filters=None, batch_size=STREAM_BATCH_SIZE):
+    if table not in EXPORT_FILTERS:
+        raise ValueError(f"{table} can't be exported")
+    export_format = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if export_format is None:
+        raise ValueError(f"unknown export format for {path}, use one of {', '.join(EXPORT_FORMATS)}")
+
+    conditions = []
+    params = []
+    for name, value in (filters or {}).items():
+        if name not in EXPORT_FILTERS[table]:
+            raise ValueError(f"{table} can't be filtered by {name}")
+        conditions.append(f"{EXPORT_FILTERS[table][name]}=?")
+        params.append(value)
+    query = f"SELECT * FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    cursor.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    batches = iter(lambda: cursor.fetchmany(batch_size), [])
+    return EXPORT_WRITERS[export_format](path, columns, batches)
+
+
+# Prints every user straight from the database, streamed or page_size rows at a time
+def print_database(page_size=None):
     print("----- Students -----")
-    for student in student_objects:
-        print(student.ID, student.firstname, student.lastname, student.expdgradyr, student.major, student.email)
+    print_rows("""SELECT * FROM student""", page_size=page_size, format_row=format_fields, operation='print_database')
 
     print("----- Instructors -----")
-    for instructor in instructor_object:
-        print(instructor.ID, instructor.firstname, instructor.lastname, instructor.title, instructor.yearofhire,
-              instructor.department, instructor.email)
+    print_rows("""SELECT * FROM instructor""", page_size=page_size, format_row=format_fields, operation='print_database')
 
     print("----- Admins -----")
-    for Admin in admin_objects:
-        print(Admin.ID, Admin.firstname, Admin.lastname, Admin.title, Admin.office, Admin.email)
-
+    print_rows("""SELECT * FROM admin""", page_size=page_size, format_row=format_fields, operation='print_database')
 
-# Init functions when program is run
-admin_objects = add_admin()
-student_objects = add_student()
-instructor_object = add_instructor()
-print_database()
 
+# User class for each role, by table name
+USER_CLASSES = {'admin': Admin, 'instructor': instructor, 'student': student}
 
-# Converts the 24 hour format to 12 hour format for schedule printing
-def convert_time_format(time):
-    hours, minutes = time.split(':')
-    period = 'AM' if int(hours) < 12 else 'PM'
 
-    if int(hours) > 12:
-        hours = str(int(hours) - 12)
-
-    return f"{hours}:{minutes} {period}"
+# Finds the user with this email and ID number, or returns None if there is none
+@timed('login')
+def authenticate(email, ID):
+    # One round trip for all three tables. Each arm is a primary key lookup on ID, rows are tagged with their
+    # role and padded to the same width, and LIMIT 1 stops SQLite at the first table that matches.
+    cursor.execute("""SELECT 'admin', *, NULL FROM admin WHERE ID=? AND EMAIL=?
+                      UNION ALL SELECT 'instructor', * FROM instructor WHERE ID=? AND EMAIL=?
+                      UNION ALL SELECT 'student', *, NULL FROM student WHERE ID=? AND EMAIL=?
+                      LIMIT 1""", (ID, email) * 3)
+    user_data = cursor.fetchone()
+    if not user_data:
+        return None
+    role = user_data[0]
+    return USER_CLASSES[role](*user_data[1:8 if role == 'instructor' else 7])
 
 
 # Login function for all users
@@ -629,35 +2036,22 @@ def login():
         username = input("Please enter email: ")
         password = input("Please enter id number: ")
 
-        cursor.execute("""SELECT * FROM admin WHERE EMAIL=? AND ID=?""", (username, password))
-        admin_data = cursor.fetchone()
-
-        cursor.execute("""SELECT * FROM instructor WHERE EMAIL=? AND ID=?""", (username, password))
-        instructor_data = cursor.fetchone()
-
-        cursor.execute("""SELECT * FROM student WHERE EMAIL=? AND ID=?""", (username, password))
-        student_data = cursor.fetchone()
-
-        if admin_data:
+        found = authenticate(username, password)
+        if isinstance(found, Admin):
             print("Welcome, Admin!")
-            access_granted = True
-            return Admin(*admin_data)
-        elif instructor_data:
+            return found
+        elif isinstance(found, instructor):
             print("Welcome, Instructor!")
-            access_granted = True
-            return instructor(*instructor_data)
-        elif student_data:
+            return found
+        elif isinstance(found, student):
             print("Welcome, Student!")
-            access_granted = True
-            return student(*student_data)
+            return found
         else:
             print("Incorrect username or password, please try again")
 
 
 # Logout function -- Give the user the option to either switch users (log out and log back in) or end the program.
 def logout():
-    global access_granted
-    access_granted = False
     while True:
         choice = input("Do you want to exit the program? (Yes/No): ")
         if choice.lower() == "yes":
@@ -672,138 +2066,531 @@ def logout():
             print("Invalid choice. Please enter 'Yes' or 'No'.")
 
 
-# default login functionality
-access_granted = False
-logged_in_user = None
-while not access_granted:
-    logged_in_user = login()
-    access_granted = True
-
-# main menu. Changes based on user type that is logged in. the isinstance will check the user type to see what type of object they are.
-while True:
-    # Admin menu
-    if isinstance(logged_in_user, Admin):
-        print("Welcome to the admin control panel, what would you like to do?")
-        print("1. Add/Remove User")
-        print("2. Update User")
-        print("3. Print all...")
-        print("4. Add/Remove Course")
-        print("5. Update Course")
-        print("6. Exit")
-
-        choice = input("Enter your choice (1-6): ")
-
-        if choice == "1":
-            print("Would you like to add or remove a user?")
-            choice = input("Enter add or remove: ")
-            if choice == "add":
-                logged_in_user.addRemoveUser(True)
-            elif choice == "remove":
-                logged_in_user.addRemoveUser(False)
+# State of one logged in session: who is logged in. The terminal menus use one, and server mode keeps one per
+# connection
+class Session:
+    def __init__(self):
+        self.user = None
+
+    @property
+    def access_granted(self):
+        return self.user is not None
+
+
+# Loads one user by role and ID without logging in, or returns None if there is no such user
+def find_user(role, ID):
+    cursor.execute(f"""SELECT * FROM {role} WHERE ID=?""", (ID,))
+    user_data = cursor.fetchone()
+    return USER_CLASSES[role](*user_data) if user_data else None
+
+
+# Brings the database schema up to date before anything else touches it
+def prepare_database():
+    migrate()
+
+
+# Raised for a command line that can't be parsed, instead of argparse exiting the program
+class CommandError(Exception):
+    pass
+
+
+class CommandParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise CommandError(f"{self.prog}: {message}")
+
+
+# Reads a H:MM time argument as minutes after midnight
+def time_argument(value):
+    try:
+        return time_to_minutes(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time {value!r}, use H:MM")
+
+
+# Reads a NAME=VALUE export filter argument
+def filter_argument(value):
+    name, separator, filter_value = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"invalid filter {value!r}, use NAME=VALUE")
+    return name, filter_value
+
+
+# Reads a section capacity argument: a whole number, or none for no limit
+def capacity_argument(value):
+    if value.lower() == 'none':
+        return None
+    if not value.isdigit():
+        raise argparse.ArgumentTypeError(f"invalid capacity {value!r}, use a whole number or none")
+    return int(value)
+
+
+# Commands that run one operation without any prompts. They are trusted operator commands, so there is no login;
+# users are named by role and ID
+def command_parser():
+    parser = CommandParser(prog='main.py', description="Course registration. Run without a command for the menus.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('add-course', "add courses to a schedule"), ('drop-course', "drop courses from a schedule")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('role', choices=('student', 'instructor'))
+        command.add_argument('id', type=int)
+        command.add_argument('crns', nargs='+', metavar='CRN')
+
+    command = commands.add_parser('schedule', help="print a schedule")
+    command.add_argument('role', choices=('student', 'instructor'))
+    command.add_argument('id', type=int)
+
+    command = commands.add_parser('class-list', help="print an instructor's class list")
+    command.add_argument('id', type=int)
+
+    command = commands.add_parser('set-capacity', help="set how many students a section holds ('none' for no limit)")
+    command.add_argument('crn')
+    command.add_argument('capacity', type=capacity_argument)
+
+    add_search_command(commands)
+    add_transfer_commands(commands)
+
+    # stats only covers this process, so it is for the end of a run script; a server session has its own stats
+    # command, and SIGUSR1 or REGISTRATION_METRICS get them from any other running program
+    command = commands.add_parser('stats', help="print this process's query and operation timings as JSON "
+                                                "(e.g. as the last line of a run script)")
+    command.add_argument('--output', help="write them to this file instead")
+
+    command = commands.add_parser('run', help="run a script of commands, one per line ('-' reads stdin)")
+    command.add_argument('script')
+
+    command = commands.add_parser('serve', help="serve many sessions over TCP")
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8765)
+    command.add_argument('--workers', type=int, default=8, help="threads running database work")
+    return parser
+
+
+def add_search_command(commands, add_help=True):
+    command = commands.add_parser('search', help="search courses", add_help=add_help)
+    command.add_argument('--dept')
+    command.add_argument('--semester')
+    command.add_argument('--year', type=int)
+    command.add_argument('--days', type=str.upper)
+    command.add_argument('--start-after', type=time_argument, metavar='H:MM')
+    command.add_argument('--end-before', type=time_argument, metavar='H:MM')
+    command.add_argument('--min-credits', type=int)
+    command.add_argument('--max-credits', type=int)
+    command.add_argument('--title')
+    command.add_argument('--keywords')
+    command.add_argument('--sort', type=str.upper)
+    command.add_argument('--limit', type=int)
+
+
+def add_transfer_commands(commands, add_help=True):
+    command = commands.add_parser('import', help="import a .csv or .jsonl file", add_help=add_help)
+    command.add_argument('table', choices=tuple(IMPORT_COLUMNS))
+    command.add_argument('path')
+
+    command = commands.add_parser('export', help="export a table to a .csv, .jsonl or .rcol file", add_help=add_help)
+    command.add_argument('table', choices=tuple(EXPORT_FILTERS))
+    command.add_argument('path')
+    command.add_argument('--filter', type=filter_argument, action='append', default=[], metavar='NAME=VALUE')
+
+
+# Requests a server session accepts. The schedule commands act on the logged in user instead of naming one
+def session_parser():
+    parser = CommandParser(prog='session', add_help=False)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('login', add_help=False)
+    command.add_argument('email')
+    command.add_argument('id')
+    commands.add_parser('logout', add_help=False)
+    commands.add_parser('schedule', add_help=False)
+    commands.add_parser('class-list', add_help=False)
+    for name in ('add-course', 'drop-course'):
+        commands.add_parser(name, add_help=False).add_argument('crns', nargs='+', metavar='CRN')
+    add_search_command(commands, add_help=False)
+    add_transfer_commands(commands, add_help=False)
+    commands.add_parser('stats', add_help=False)
+    return parser
+
+
+# Runs one command given as a list of arguments. Returns the exit status: 0 if it succeeded, 1 if not
+def run_command(argv):
+    try:
+        args = command_parser().parse_args(argv)
+    except CommandError as error:
+        print(error)
+        return 1
+
+    if args.command in ('add-course', 'drop-course'):
+        member = find_user(args.role, args.id)
+        if member is None:
+            print(f"No {args.role} with ID {args.id}.")
+            return 1
+        member.loadSchedule()
+        changed = [scheduling.change(member, crn, args.command == 'add-course') for crn in args.crns]
+        return 0 if all(changed) else 1
+    elif args.command in ('schedule', 'class-list'):
+        role = 'instructor' if args.command == 'class-list' else args.role
+        member = find_user(role, args.id)
+        if member is None:
+            print(f"No {role} with ID {args.id}.")
+            return 1
+        if args.command == 'class-list':
+            member.printClassList()
+        else:
+            member.loadSchedule()
+            member.printSchedule()
+    elif args.command == 'set-capacity':
+        if course_cache.get(args.crn) is None:
+            print("Course with CRN", args.crn, "does not exist.")
+            return 1
+        try:
+            set_capacity(args.crn, args.capacity)
+        except ValueError as error:
+            print("Error:", error)
+            return 1
+    elif args.command in ('search', 'import', 'export'):
+        return run_shared_command(args)
+    elif args.command == 'stats':
+        metrics.dump(args.output)
+    elif args.command == 'run':
+        return run_script(args.script)
+    elif args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, args.workers))
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+# Runs a search, import or export command, which work the same from the command line and in a server session.
+# Returns the exit status
+def run_shared_command(args):
+    if args.command == 'search':
+        if args.sort is not None and args.sort not in course_columns():
+            print("Invalid sort column.")
+            return 1
+        print_search_results(search_courses(args.dept, args.semester, args.year, args.days,
+                                            args.start_after, args.end_before, args.min_credits, args.max_credits,
+                                            args.title, args.keywords, args.sort, args.limit))
+    elif args.command == 'import':
+        if args.table == 'courses':
+            create_courses_table()
+        try:
+            report = import_file(args.table, args.path)
+        except OSError as error:
+            print("Error: could not read", args.path, "-", error)
+            return 1
+        report.printReport()
+        return 1 if report.errors else 0
+    elif args.command == 'export':
+        try:
+            count = export_table(args.table, args.path, dict(args.filter))
+        except (OSError, ValueError) as error:
+            print("Error:", error)
+            return 1
+        print(f"Exported {count} row(s) from {args.table} to {args.path}.")
+    return 0
+
+
+# Runs a script of commands, one per line with shell-style quoting. Blank lines and lines starting with # are
+# skipped. Every line runs even if an earlier one fails; the exit status is 1 if any failed
+def run_script(path):
+    status = 0
+    with (contextlib.nullcontext(sys.stdin) if path == '-' else open(path)) as script:
+        for line_number, line in enumerate(script, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                argv = shlex.split(line)
+            except ValueError as error:
+                print(f"Line {line_number}: {error}")
+                status = 1
+                continue
+            if run_command(argv):
+                print(f"Line {line_number} failed: {line}")
+                status = 1
+    return status
+
+
+# Sends print output to a buffer belonging to the calling thread while one is set, so worker threads serving
+# different sessions never mix their output. Threads without a buffer write to the real stream
+class ThreadOutput:
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    # Collects everything the calling thread prints during a with block
+    @contextlib.contextmanager
+    def capture(self):
+        self.local.buffer = buffer = io.StringIO()
+        try:
+            yield buffer
+        finally:
+            self.local.buffer = None
+
+
+# Installs ThreadOutput as sys.stdout if it isn't already, and returns it
+def thread_output():
+    if not isinstance(sys.stdout, ThreadOutput):
+        sys.stdout = ThreadOutput(sys.stdout)
+    return sys.stdout
+
+
+# Runs one request line for a server session. Returns (succeeded, printed output)
+def handle_request(session, line):
+    with thread_output().capture() as output:
+        try:
+            succeeded = session_request(session, shlex.split(line))
+        except (CommandError, ValueError, sqlite3.Error) as error:
+            print("Error:", error)
+            succeeded = False
+        except (Exception, SystemExit) as error:
+            # one bad request fails on its own instead of taking the server down with it
+            print("Error: request failed -", repr(error))
+            succeeded = False
+    return succeeded, output.getvalue()
+
+
+def session_request(session, argv):
+    args = session_parser().parse_args(argv)
+    if args.command == 'login':
+        session.user = authenticate(args.email, args.id)
+        if not session.access_granted:
+            print("Incorrect username or password, please try again")
+            return False
+        if isinstance(session.user, member):
+            session.user.loadSchedule()
+        print(f"Welcome, {session.user.firstname}!")
+        return True
+    if not session.access_granted:
+        print("Please log in first.")
+        return False
+    if args.command == 'logout':
+        session.user = None
+        print("Logging out...")
+        return True
+    if args.command in ('import', 'export'):
+        if not isinstance(session.user, Admin):
+            print("Only admins can import and export tables.")
+            return False
+        return run_shared_command(args) == 0
+    if args.command == 'stats':
+        if not isinstance(session.user, Admin):
+            print("Only admins can view the server's stats.")
+            return False
+        metrics.dump()
+        return True
+    if args.command == 'search':
+        return run_shared_command(args) == 0
+    if not isinstance(session.user, member) or (args.command == 'class-list'
+                                               and not isinstance(session.user, instructor)):
+        print("That command is not available to you.")
+        return False
+    if args.command == 'schedule':
+        session.user.printSchedule()
+    elif args.command == 'class-list':
+        session.user.printClassList()
+    else:
+        changed = [scheduling.change(session.user, crn, args.command == 'add-course') for crn in args.crns]
+        return all(changed)
+    return True
+
+
+# Starts a line-based TCP server hosting many sessions in one process. Each connection gets its own Session and
+# sends one request per line (the session commands, plus quit). Each reply is the request's output followed by a
+# line reading OK or FAILED. Requests run on a pool of worker threads, each with its own pooled connection, so a
+# slow query in one session doesn't hold up the rest, while the course cache and scheduling service are shared
+async def start_server(host, port, workers=8):
+    thread_output()
+    executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='session')
+    loop = asyncio.get_running_loop()
+
+    async def handle_connection(reader, writer):
+        session = Session()
+        writer.write(b"Connected. Log in with: login EMAIL ID\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode(errors='replace').strip()
+                if line == 'quit':
+                    break
+                if not line:
+                    continue
+                succeeded, output = await loop.run_in_executor(executor, handle_request, session, line)
+                writer.write((output + ('OK' if succeeded else 'FAILED') + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    server.executor = executor
+    return server
+
+
+async def serve(host, port, workers=8):
+    server = await start_server(host, port, workers)
+    print(f"Serving on {host}:{server.sockets[0].getsockname()[1]}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        server.executor.shutdown()
+
+
+# Runs a command if one is given on the command line, otherwise the login screen and menus. Users are looked up in
+# the database as they log in or are named. Sending the process SIGUSR1 dumps its stats while it runs
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    install_metrics_signal()
+    try:
+        prepare_database()
+    except MigrationError as error:
+        print("Error: the database could not be upgraded -", error)
+        return 1
+    if argv:
+        return run_command(argv)
+
+    # default login functionality
+    session = Session()
+    while not session.access_granted:
+        session.user = login()
+
+    if isinstance(session.user, (student, instructor)):
+        session.user.loadSchedule()
+
+    # main menu. Changes based on user type that is logged in. the isinstance will check the user type to see what type of object they are.
+    while True:
+        # Admin menu
+        if isinstance(session.user, Admin):
+            print("Welcome to the admin control panel, what would you like to do?")
+            print("1. Add/Remove User")
+            print("2. Update User")
+            print("3. Print all...")
+            print("4. Add/Remove Course")
+            print("5. Set Course Capacity")
+            print("6. Bulk Import")
+            print("7. Bulk Export")
+            print("8. Exit")
+
+            choice = input("Enter your choice (1-8): ")
+
+            if choice == "1":
+                print("Would you like to add or remove a user?")
+                choice = input("Enter add or remove: ")
+                if choice == "add":
+                    session.user.addRemoveUser(True)
+                elif choice == "remove":
+                    session.user.addRemoveUser(False)
+                else:
+                    print("Invalid Choice")
+            elif choice == "2":
+                session.user.modifyUser()
+            elif choice == "3":
+                page_size = input("Rows per page (leave blank to print everything): ")
+                page_size = int(page_size) if page_size.isdigit() else None
+                print_database(page_size)
+                session.user.printRoster(page_size)
+            elif choice == "4":
+                if create_courses_table():
+                    print("The 'courses' table has been created")
+
+                print("Would you like to add or remove a course?")
+                choice = input("Enter add or remove: ")
+                if choice == "add":
+                    session.user.addRemoveCourse(True)
+                elif choice == "remove":
+                    session.user.addRemoveCourse(False)
+                else:
+                    print("Invalid Choice")
+            elif choice == "5":
+                session.user.setCourseCapacity()
+            elif choice == "6":
+                session.user.bulkImport()
+            elif choice == "7":
+                session.user.bulkExport()
+            elif choice == "8":
+                logout()
+                break
             else:
-                print("Invalid Choice")
-        elif choice == "2":
-            logged_in_user.modifyUser()
-        elif choice == "3":
-            print_database()
-            logged_in_user.printRoster()
-        elif choice == "4":
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='courses'")
-            table_exists = cursor.fetchone()
-            if not table_exists:
-                cursor.execute("""
-                    CREATE TABLE courses (
-                        CRN INTEGER,
-                        TITLE TEXT,
-                        DEPT TEXT,
-                        TIME TEXT,
-                        DAYS TEXT,
-                        SEMESTER TEXT,
-                        YEAR INTEGER,
-                        CREDITS INTEGER
-                    )
-                """)
-                db.commit()
-                print("The 'courses' table has been created")
-
-            print("Would you like to add or remove a course?")
-            choice = input("Enter add or remove: ")
-            if choice == "add":
-                logged_in_user.addRemoveCourse(True)
-            elif choice == "remove":
-                logged_in_user.addRemoveCourse(False)
+                print("Invalid choice. Please try again.")
+
+        # instructor menu
+        elif isinstance(session.user, instructor):
+            print("Welcome to the instructor control panel, what would you like to do?")
+            print("1. Print Schedule")
+            print("2. Print Class List")
+            print("3. Add/Drop Course")
+            print("4. Search Course")
+            print("5. Exit")
+
+            choice = input("Enter your choice (1-4): ")
+
+            if choice == "1":
+                session.user.printSchedule()
+            elif choice == "2":
+                session.user.printClassList()
+            elif choice == "3":
+                ad = input("Add or drop? (add/drop): ")
+                if ad == "add":
+                    ad = True
+                else:
+                    ad = False
+                session.user.addDropCourse(ad)
+            elif choice == "4":
+                session.user.searchCourse()
+            elif choice == "5":
+                logout()
+                break
             else:
-                print("Invalid Choice")
-        elif choice == "5":
-            print("Test5")
-        elif choice == "6":
-            logout()
-            break
-        else:
-            print("Invalid choice. Please try again.")
-
-    # instructor menu
-    elif isinstance(logged_in_user, instructor):
-        print("Welcome to the instructor control panel, what would you like to do?")
-        print("1. Print Schedule")
-        print("2. Print Class List")
-        print("3. Add/Drop Course")
-        print("4. Search Course")
-        print("5. Exit")
-
-        choice = input("Enter your choice (1-4): ")
-
-        if choice == "1":
-            logged_in_user.printSchedule()
-        elif choice == "2":
-            logged_in_user.printClassList()
-        elif choice == "3":
-            ad = input("Add or drop? (add/drop): ")
-            if ad == "add":
-                ad = True
+                print("Invalid choice. Please try again.")
+
+        # Student menu
+        elif isinstance(session.user, student):
+            print("Welcome to the student control panel, what would you like to do?")
+            print("1. Print Schedule")
+            print("2. Search Course")
+            print("3. Add/Drop Course")
+            print("4. Exit")
+
+            choice = input("Enter your choice (1-4): ")
+
+            if choice == "1":
+                session.user.printSchedule()
+            elif choice == "2":
+                session.user.searchCourse()
+            elif choice == "3":
+                ad = input("Add or drop? (add/drop): ")
+                if ad == "add":
+                    ad = True
+                else:
+                    ad = False
+                session.user.addDropCourse(ad)
+            elif choice == "4":
+                logout()
+                break
             else:
-                ad = False
-            logged_in_user.addDropCourse(ad)
-        elif choice == "4":
-            logged_in_user.searchCourse()
-        elif choice == "5":
-            logout()
-            break
+                print("Invalid choice. Please try again.")
         else:
-            print("Invalid choice. Please try again.")
-
-    # Student menu
-    elif isinstance(logged_in_user, student):
-        print("Welcome to the student control panel, what would you like to do?")
-        print("1. Print Schedule")
-        print("2. Search Course")
-        print("3. Add/Drop Course")
-        print("4. Exit")
-
-        choice = input("Enter your choice (1-4): ")
-
-        if choice == "1":
-            logged_in_user.printSchedule()
-        elif choice == "2":
-            logged_in_user.searchCourse()
-        elif choice == "3":
-            ad = input("Add or drop? (add/drop): ")
-            if ad == "add":
-                ad = True
-            else:
-                ad = False
-            logged_in_user.addDropCourse(ad)
-        elif choice == "4":
-            logout()
+            print("Errror!!")
+            db.commit()
+            db.close()
             break
-        else:
-            print("Invalid choice. Please try again.")
-    else:
-        print("Errror!!")
-        db.commit()
-        db.close()
-        break
-
-
 
 
+if __name__ == '__main__':
+    sys.exit(main())
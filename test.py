@@ -1,14 +1,43 @@
+import asyncio
+import io
+import json
+import os
+import random
+import signal
+import tempfile
+import threading
+import time
 import unittest
 from unittest import TestCase, mock
 from unittest.mock import patch
 import sqlite3
 import main
+import benchmark
+import loadtest
 
 # Import the necessary functions or classes from your module
 from main import login, logout
 from main import instructor, student, Admin
 
 
+# Every test runs against a scratch copy of assignment3.db, so running the suite never modifies the tracked file
+def setUpModule():
+    global scratch_dir, original_database
+    scratch_dir = tempfile.TemporaryDirectory()
+    original_database = (main.pool, main.db, main.cursor)
+    path = os.path.join(scratch_dir.name, 'assignment3.db')
+    loadtest.copy_database(main.pool.database, path)
+    main.use_database(path)
+
+
+def tearDownModule():
+    main.pool.closeAll()
+    main.pool, main.db, main.cursor = original_database
+    main.course_column_cache = None
+    main.course_cache.invalidate()
+    scratch_dir.cleanup()
+
+
 
 
 class LoginTestCase(TestCase):
@@ -72,7 +101,7 @@ class LoginTestCase(TestCase):
     @patch('builtins.input', side_effect=['bobbyb', '001'])
     def test_login_admin(self, mock_input):
         with patch('main.cursor') as mock_cursor:
-            mock_cursor.fetchone.return_value = ('001', 'bob', 'bobby', 'Admin User', 'somewhere', 'bobbyb')
+            mock_cursor.fetchone.return_value = ('admin', '001', 'bob', 'bobby', 'Admin User', 'somewhere', 'bobbyb', None)
             with patch('main.print') as mock_print:
                 user = login()
                 self.assertIsInstance(user, Admin)
@@ -81,7 +110,7 @@ class LoginTestCase(TestCase):
     @patch('builtins.input', side_effect=['bassettl', '002'])
     def test_login_instructor(self, mock_input):
         with patch('main.cursor') as mock_cursor:
-            mock_cursor.fetchone.return_value = ('002', 'Luke', 'Bassett', 'teacher', '2020', 'math', 'bassettl')
+            mock_cursor.fetchone.return_value = ('instructor', '002', 'Luke', 'Bassett', 'teacher', '2020', 'math', 'bassettl')
             with patch('main.print') as mock_print:
                 user = login()
                 self.assertIsInstance(user, instructor)
@@ -90,12 +119,20 @@ class LoginTestCase(TestCase):
     @patch('builtins.input', side_effect=['krupienskij', '10012'])
     def test_login_student(self, mock_input):
         with patch('main.cursor') as mock_cursor:
-            mock_cursor.fetchone.return_value = ('10012', 'Jack', 'Krupienski', '2024', 'CE', 'krupienskij')
+            mock_cursor.fetchone.return_value = ('student', '10012', 'Jack', 'Krupienski', '2024', 'CE', 'krupienskij', None)
             with patch('main.print') as mock_print:
                 user = login()
                 self.assertIsInstance(user, student)
                 mock_print.assert_called_with("Welcome, Student!")
 
+    @patch('builtins.input', side_effect=['krupienskij', '10012'])
+    def test_login_resolves_role_in_one_query(self, mock_input):
+        with patch('main.cursor', mock.Mock(wraps=self.cursor)) as mock_cursor, patch('main.print'):
+            user = login()
+            self.assertIsInstance(user, student)
+            self.assertEqual(user.email, 'krupienskij')
+            self.assertEqual(mock_cursor.execute.call_count, 1)
+
     @patch('builtins.input', side_effect=['invalid', 'invalid123'])
     def test_login_incorrect_credentials(self, mock_input):
         with patch('main.cursor') as mock_cursor:
@@ -152,9 +189,9 @@ class testprintRoster(TestCase):
             #ad.printRoster()
 
             mock_cursor.fetchall.return_value = ['----- Courses -----']
-        with patch('builtins.print') as mock_print:
+        with patch('main.cursor', self.cursor), patch('builtins.print') as mock_print:
             ad.printRoster()
-            expected_calls = unittest.mock.call[('----- Courses -----')]
+            expected_calls = [unittest.mock.call('----- Courses -----')]
             mock_print.assert_has_calls(expected_calls)
 
 
@@ -205,6 +242,12 @@ class LogoutTestCase(TestCase):
                 mock_login.assert_called_once()
 
 
+# Answers for search_course_prompt, in the order it asks for them. Anything not given is left blank
+def search_inputs(dept='', semester='', year='', days='', start='', end='', min_credits='', max_credits='',
+                  title='', keywords='', sort='', limit=''):
+    return [dept, semester, year, days, start, end, min_credits, max_credits, title, keywords, sort, limit]
+
+
 class InstructorTestCase(TestCase):
     def setUp(self):
         self.conn = sqlite3.connect(':memory:')  # Create an in-memory SQLite database
@@ -213,51 +256,85 @@ class InstructorTestCase(TestCase):
         # Create a sample courses table with required columns
         self.cursor.execute('''
             CREATE TABLE courses (
-                CRN INTEGER PRIMARY KEY,
-                CourseName TEXT,
-                StartTime TEXT,
-                EndTime TEXT,
-                Day TEXT
+                CRN INTEGER,
+                TITLE TEXT,
+                DEPT TEXT,
+                TIME TEXT,
+                DAYS TEXT,
+                SEMESTER TEXT,
+                YEAR INTEGER,
+                CREDITS INTEGER
             )
         ''')
 
         # Insert test data into the courses table
         self.cursor.execute('''
             INSERT INTO courses VALUES
-            (1001, 'Course 1', '9:00', '10:00', 'Monday'),
-            (1002, 'Course 2', '10:30', '11:30', 'Wednesday'),
-            (1003, 'Course 3', '13:00', '14:00', 'Friday')
+            (1001, 'Course 1', 'ELEC', '9:00-10:00', 'M', 'Summer', 2023, 3),
+            (1002, 'Course 2', 'MATH', '10:30-11:30', 'W', 'Summer', 2023, 4),
+            (1003, 'Course 3', 'ELEC', '13:00-14:00', 'F', 'Summer', 2023, 4),
+            (1004, 'Topics in Course Design', 'ELEC', '8:00-8:50', 'MW', 'Fall', 2023, 2)
         ''')
+        self.patches = [patch('main.cursor', mock.Mock(wraps=self.cursor)), patch('main.course_column_cache', None)]
+        for p in self.patches:
+            p.start()
 
     def tearDown(self):
+        for p in self.patches:
+            p.stop()
         self.cursor.close()
         self.conn.close()
 
     def test_search_course_valid_choice(self):
-        with patch('builtins.input', side_effect=['2', 'Course 2']):
-            with patch('main.cursor') as mock_cursor:
-                with patch('main.print') as mock_print:
-                    inst = instructor('20012', 'Test', 'Prgm', 'Instructor', '2020', 'Math', 'Doej')
-                    inst.searchCourse()
-                    mock_cursor.execute.assert_called_with("PRAGMA table_info(courses)")
-                    mock_print.assert_called_with("Search Results:\n(1002, 'Course 2', '10:30', '11:30', 'Wednesday')")
+        with patch('builtins.input', side_effect=search_inputs(title='Course 2')):
+            with patch('main.print') as mock_print:
+                inst = instructor('20012', 'Test', 'Prgm', 'Instructor', '2020', 'Math', 'Doej')
+                inst.searchCourse()
+                mock_print.assert_any_call("Search Results:")
+                mock_print.assert_called_with((1002, 'Course 2', 'MATH', '10:30-11:30', 'W', 'Summer', 2023, 4))
 
     def test_search_course_invalid_choice(self):
-        with patch('builtins.input', side_effect=['5', 'value']):
+        with patch('builtins.input', side_effect=search_inputs(sort='ROOM')):
             with patch('main.print') as mock_print:
                 inst = instructor('20012', 'Test', 'Prgm', 'Instructor', '2020', 'Math', 'Doej')
                 inst.searchCourse()
-                mock_print.assert_called_with("No results found.")
+                mock_print.assert_called_with("Invalid sort column.")
 
     def test_search_course_no_results(self):
-        with patch('builtins.input', side_effect=['1', 'Unknown']):
-            with patch('main.cursor') as mock_cursor:
-                with patch('main.print') as mock_print:
-                    inst = instructor('20012', 'Test', 'Prgm', 'Instructor', '2020', 'Math', 'Doej')
-                    inst.searchCourse()
-                    mock_cursor.execute.assert_called_with("PRAGMA table_info(courses)")
-                    mock_cursor.fetchall.assert_called()
-                    mock_print.assert_called_with("No results found.")
+        with patch('builtins.input', side_effect=search_inputs(title='Unknown') * 2):
+            with patch('main.print') as mock_print:
+                inst = instructor('20012', 'Test', 'Prgm', 'Instructor', '2020', 'Math', 'Doej')
+                inst.searchCourse()
+                inst.searchCourse()
+                # the column list is only read once
+                pragma_calls = [c for c in main.cursor.execute.call_args_list if c.args[0].startswith("PRAGMA")]
+                self.assertEqual(len(pragma_calls), 1)
+                mock_print.assert_called_with("No results found.")
+
+    def test_combined_filters(self):
+        results = main.search_courses(dept='ELEC', min_credits=3, start_after=main.time_to_minutes('9:00'),
+                                      end_before=main.time_to_minutes('14:00'), sort='TIME')
+        self.assertEqual([course[0] for course in results], [1001, 1003])
+        results = main.search_courses(days='MWF', semester='Summer', sort='CREDITS', limit=2)
+        self.assertEqual([course[0] for course in results], [1001, 1002])
+
+    def test_title_prefix_and_substring(self):
+        self.assertEqual([c[0] for c in main.search_courses(title='course*')], [1001, 1002, 1003])
+        self.assertEqual([c[0] for c in main.search_courses(title='course')], [1001, 1002, 1003, 1004])
+        self.assertEqual(main.search_courses(title='100%'), [])
+
+    def test_keyword_search_is_ranked_and_kept_in_sync(self):
+        self.assertTrue(main.create_course_search_index())
+        self.cursor.execute("INSERT INTO courses VALUES (1005, 'Course Design Studio', 'ARCH', '9:00-11:50', 'TR', "
+                            "'Fall', 2023, 4)")
+        self.cursor.execute("UPDATE courses SET TITLE='Calculus' WHERE CRN=1002")
+        self.cursor.execute("DELETE FROM courses WHERE CRN=1003")
+        self.assertEqual([c[0] for c in main.search_courses(keywords='cours desi')], [1005, 1004])
+        self.assertEqual([c[0] for c in main.search_courses(keywords='calc')], [1002])
+        self.assertEqual([c[0] for c in main.search_courses(keywords='course', dept='ELEC')], [1001, 1004])
+
+    def test_keyword_search_without_fts_index(self):
+        self.assertEqual([c[0] for c in main.search_courses(keywords='course design')], [1004])
 
 class AdminTestCase(TestCase):
     def setUp(self):
@@ -278,6 +355,13 @@ class AdminTestCase(TestCase):
                     )
                 )
 
+    def test_add_course_rejects_non_numeric_crn(self):
+        with mock.patch("main.cursor") as mock_cursor, mock.patch("builtins.print") as mock_print:
+            with mock.patch("builtins.input", side_effect=["ABC12"]):
+                self.admin.addRemoveCourse(True)
+            mock_cursor.execute.assert_not_called()
+            mock_print.assert_called_with("Error: CRN", "ABC12", "is not a number.")
+
     def test_remove_course(self):
         with mock.patch("main.cursor") as mock_cursor:
             with mock.patch("builtins.input") as mock_input:
@@ -292,11 +376,913 @@ class AdminTestCase(TestCase):
                 mock_input.assert_any_call("Course CRN: ")
                 mock_input.assert_called_with("Are you sure you want to remove CRN: 36482? (Yes/No): ")
 
+class UserRecordTestCase(TestCase):
+    def test_user_records_are_slotted(self):
+        for new_user in (student(1, 'a', 'b', 2024, 'BSCO', 'e'), instructor(2, 'a', 'b', 't', 2020, 'BSEE', 'e'),
+                         Admin(3, 'a', 'b', 't', 'o', 'e')):
+            self.assertFalse(hasattr(new_user, '__dict__'))
+
+
+class StreamingOutputTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("CREATE TABLE courses (CRN, TITLE)")
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?)", [(n, f'Course {n}') for n in range(1, 6)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_stream_rows_writes_one_chunk_per_batch(self):
+        out = mock.Mock()
+        with patch('main.cursor', self.cursor):
+            main.stream_rows("SELECT * FROM courses", out=out, batch_size=2, format_row=main.format_fields)
+        self.assertEqual(out.write.call_count, 3)
+        self.assertEqual(out.write.call_args_list[0], mock.call("1 Course 1\n2 Course 2\n"))
+
+    @patch('builtins.input', side_effect=['n', 'n', 'n', 'p', 'q'])
+    def test_page_rows_navigates_pages(self, mock_input):
+        out = io.StringIO()
+        with patch('main.cursor', self.cursor), patch('main.print') as mock_print:
+            main.page_rows("SELECT CRN FROM courses", page_size=2, format_row=main.format_fields, out=out)
+        self.assertEqual(out.getvalue(), "1\n2\n3\n4\n5\n3\n4\n")
+        mock_print.assert_called_once_with("No more pages in that direction.")
+
+
+class EnrollmentTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                               SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)", [
+            (33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3),
+            (34285, 'ADVANCED DIGITAL CIRCUIT DESIGN', 'ELEC', '12:30-13:50', 'WF', 'Summer', 2023, 4),
+        ])
+        self.patches = [patch('main.cursor', self.cursor), patch('main.db', self.conn), patch('main.print')]
+        for p in self.patches:
+            p.start()
+        main.migrate()
+        main.course_cache.invalidate()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def test_schedule_persists_across_sessions(self):
+        s = main.student(10012, 'Jack', 'Krupienski', 2024, 'BSCO', 'krupienskij')
+        with patch('builtins.input', side_effect=['33950', '34285', '33950']):
+            s.addDropCourse(True)
+            s.addDropCourse(True)
+            s.addDropCourse(False)
+
+        same_student = main.student(10012, 'Jack', 'Krupienski', 2024, 'BSCO', 'krupienskij')
+        same_student.loadSchedule()
+        self.assertEqual(same_student.schedule, ['34285'])
+        self.assertEqual(self.cursor.execute("SELECT * FROM enrollment").fetchall(),
+                         [(10012, 'student', 34285, 'Summer', 2023)])
+
+    def test_class_list_groups_students_by_section(self):
+        self.cursor.execute("CREATE TABLE student (ID INTEGER PRIMARY KEY, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL)")
+        self.cursor.executemany("INSERT INTO student VALUES (?,?,?,?,?,?)", [
+            (10001, 'Isaac', 'Newton', 1668, 'BSAS', 'newtoni'),
+            (10002, 'Marie', 'Curie', 1903, 'BSAS', 'curiem'),
+        ])
+        self.cursor.executemany("INSERT INTO enrollment VALUES (?,?,?,?,?)", [
+            (20001, 'instructor', 33950, 'Summer', 2023),
+            (20001, 'instructor', 34285, 'Summer', 2023),
+            (10001, 'student', 33950, 'Summer', 2023),
+            (10002, 'student', 33950, 'Summer', 2023),
+        ])
+        inst = main.instructor(20001, 'Joseph', 'Fourier', 'Full Prof.', 1820, 'BSEE', 'fourierj')
+        with patch('sys.stdout', new_callable=io.StringIO) as out:
+            inst.printClassList()
+        self.assertEqual(out.getvalue(),
+                         "\nCRN: 33950 | Course: APPLIED PROGRAMMING CONCEPTS\n"
+                         "10002 Marie Curie BSAS curiem\n"
+                         "10001 Isaac Newton BSAS newtoni\n"
+                         "\nCRN: 34285 | Course: ADVANCED DIGITAL CIRCUIT DESIGN\n"
+                         "No students enrolled.\n")
+
+    def test_roles_do_not_share_schedules(self):
+        inst = main.instructor(10012, 'Luke', 'Bassett', 'teacher', 2020, 'math', 'bassettl')
+        with patch('builtins.input', side_effect=['33950']):
+            inst.addDropCourse(True)
+        s = main.student(10012, 'Jack', 'Krupienski', 2024, 'BSCO', 'krupienskij')
+        s.loadSchedule()
+        self.assertEqual(s.schedule, [])
+
+    def test_roles_share_the_scheduling_service(self):
+        with patch('main.scheduling', main.SchedulingService()):
+            inst = main.instructor(20001, 'Joseph', 'Fourier', 'Full Prof.', 1820, 'BSEE', 'fourierj')
+            s = main.student(10012, 'Jack', 'Krupienski', 2024, 'BSCO', 'krupienskij')
+            with patch('builtins.input', side_effect=['33950', '34285', '33950', '33950']):
+                inst.addDropCourse(True)
+                s.addDropCourse(True)
+                s.addDropCourse(True)
+                s.addDropCourse(False)
+            self.cursor.execute("INSERT INTO courses VALUES (1, 'OVERLAP', 'ELEC', '13:00-13:50', 'F', 'Summer', 2023, 3)")
+            with patch('builtins.input', side_effect=['1']):
+                s.addDropCourse(True)
+            self.assertEqual([c.CRN for c in main.scheduling.courses(s)], [34285])
+            self.assertEqual(main.scheduling.stats(), {'adds': 3, 'drops': 1, 'conflicts': 1, 'index_builds': 2})
+
+
+class CommandModeTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                               SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)", [
+            (33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3),
+            (34285, 'ADVANCED DIGITAL CIRCUIT DESIGN', 'ELEC', '12:30-13:50', 'WF', 'Summer', 2023, 4),
+        ])
+        self.cursor.execute("CREATE TABLE student (ID INTEGER PRIMARY KEY, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL)")
+        self.cursor.execute("INSERT INTO student VALUES (10012, 'Jack', 'Krupienski', 2024, 'BSCO', 'krupienskij')")
+        self.patches = [patch('main.cursor', self.cursor), patch('main.db', self.conn), patch('main.print'),
+                        patch('builtins.input', side_effect=AssertionError("command mode must not prompt"))]
+        self.mock_print = [p.start() for p in self.patches][2]
+        main.prepare_database()
+        main.course_cache.invalidate()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def enrolled(self):
+        return self.cursor.execute("SELECT CRN FROM enrollment ORDER BY CRN").fetchall()
+
+    def test_add_and_drop_courses(self):
+        self.assertEqual(main.main(['add-course', 'student', '10012', '33950', '34285']), 0)
+        self.assertEqual(main.main(['drop-course', 'student', '10012', '33950']), 0)
+        self.assertEqual(self.enrolled(), [(34285,)])
+        self.assertEqual(main.run_command(['drop-course', 'student', '10012', '33950']), 1)
+        self.assertEqual(main.run_command(['add-course', 'student', '99999', '33950']), 1)
+
+    def test_bad_arguments_fail_without_exiting(self):
+        self.assertEqual(main.run_command(['search', '--start-after', 'noon']), 1)
+        self.assertEqual(main.run_command(['enroll']), 1)
+
+    def test_script_runs_every_line(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'ops.txt')
+            with open(path, 'w') as file:
+                file.write("# nightly sync\nadd-course student 10012 33950\n\nbogus\nadd-course student 10012 34285\n")
+            self.assertEqual(main.run_command(['run', path]), 1)
+        self.assertEqual(self.enrolled(), [(33950,), (34285,)])
+        self.mock_print.assert_any_call("Line 4 failed: bogus")
+
+
+class ServerModeTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = main.ConnectionPool(os.path.join(self.tmpdir.name, 'server.db'))
+        self.patches = [patch('main.pool', self.pool), patch('main.db', main.ThreadConnection(self.pool)),
+                        patch('main.cursor', main.ThreadCursor(self.pool))]
+        for p in self.patches:
+            p.start()
+        conn = self.pool.connection()
+        conn.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                        SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        conn.execute("INSERT INTO courses VALUES (33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3)")
+        conn.execute("CREATE TABLE admin (ID INTEGER PRIMARY KEY, NAME, SURNAME, TITLE, OFFICE, EMAIL)")
+        conn.execute("CREATE TABLE instructor (ID INTEGER PRIMARY KEY, NAME, SURNAME, TITLE, HIREYEAR, DEPT, EMAIL)")
+        conn.execute("CREATE TABLE student (ID INTEGER PRIMARY KEY, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL)")
+        conn.executemany("INSERT INTO student VALUES (?,?,?,?,?,?)", [
+            (10001, 'Isaac', 'Newton', 1668, 'BSAS', 'newtoni'),
+            (10002, 'Marie', 'Curie', 1903, 'BSAS', 'curiem'),
+        ])
+        conn.commit()
+        main.prepare_database()
+        main.course_cache.invalidate()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.pool.closeAll()
+        self.tmpdir.cleanup()
+
+    def test_session_needs_login(self):
+        session = main.Session()
+        self.assertEqual(main.handle_request(session, 'schedule'), (False, "Please log in first.\n"))
+        self.assertEqual(main.handle_request(session, 'login newtoni 10002'),
+                         (False, "Incorrect username or password, please try again\n"))
+        self.assertEqual(main.handle_request(session, 'login newtoni 10001'), (True, "Welcome, Isaac!\n"))
+        self.assertFalse(main.handle_request(session, 'class-list')[0])
+
+    def test_bad_requests_fail_without_exiting(self):
+        session = main.Session()
+        main.handle_request(session, 'login newtoni 10001')
+        for line in ('search --help', 'import -h', 'export --help'):
+            self.assertFalse(main.handle_request(session, line)[0])
+        with patch('main.session_request', side_effect=AttributeError('boom')):
+            self.assertEqual(main.handle_request(session, 'schedule'),
+                             (False, "Error: request failed - AttributeError('boom')\n"))
+
+    def test_concurrent_sessions_keep_their_own_state(self):
+        async def client(port, email, ID):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            await reader.readline()
+            replies = []
+            for line in (f'login {email} {ID}', 'add-course 33950', 'quit'):
+                writer.write((line + '\n').encode())
+                if line != 'quit':
+                    replies.append((await reader.readline()).decode().strip())
+                    replies.append((await reader.readline()).decode().strip())
+            writer.close()
+            return replies
+
+        async def scenario():
+            server = await main.start_server('127.0.0.1', 0, workers=2)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await asyncio.gather(client(port, 'newtoni', 10001), client(port, 'curiem', 10002))
+            finally:
+                server.close()
+                await server.wait_closed()
+                server.executor.shutdown()
+
+        newton, curie = asyncio.run(scenario())
+        self.assertEqual(newton[:2], ['Welcome, Isaac!', 'OK'])
+        self.assertEqual(curie[:2], ['Welcome, Marie!', 'OK'])
+        self.assertEqual(newton[2:], ['Course with CRN 33950 added to your schedule.', 'OK'])
+        enrolled = self.pool.connection().execute("SELECT USER_ID FROM enrollment ORDER BY USER_ID").fetchall()
+        self.assertEqual(enrolled, [(10001,), (10002,)])
+
+
+class SeatTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = main.ConnectionPool(os.path.join(self.tmpdir.name, 'seats.db'))
+        self.patches = [patch('main.pool', self.pool), patch('main.db', main.ThreadConnection(self.pool)),
+                        patch('main.cursor', main.ThreadCursor(self.pool)), patch('main.print')]
+        self.mock_print = [p.start() for p in self.patches][3]
+        conn = self.pool.connection()
+        conn.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                        SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        conn.execute("INSERT INTO courses VALUES (33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3)")
+        conn.commit()
+        main.migrate()
+        main.course_cache.invalidate()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.pool.closeAll()
+        self.tmpdir.cleanup()
+
+    def student(self, ID):
+        return main.student(ID, 'First', 'Last', 2024, 'BSCO', f'user{ID}')
+
+    def query(self, sql):
+        return self.pool.connection().execute(sql).fetchall()
+
+    def test_full_section_waitlists_and_promotes_on_drop(self):
+        main.set_capacity('33950', 1)
+        first, second, third = self.student(1), self.student(2), self.student(3)
+        self.assertTrue(main.scheduling.change(first, '33950', True))
+        self.assertFalse(main.scheduling.change(second, '33950', True))
+        self.assertFalse(main.scheduling.change(third, '33950', True))
+        self.mock_print.assert_called_with("Course with CRN 33950 is full. You are number 2 on its waitlist.")
+        with self.assertRaises(ValueError):
+            main.set_capacity('33950', 0)
+
+        main.scheduling.change(first, '33950', False)
+        self.assertEqual(self.query("SELECT USER_ID FROM enrollment"), [(2,)])
+        self.assertEqual(self.query("SELECT TAKEN, CAPACITY FROM seats"), [(1, 1)])
+        self.assertEqual(main.waitlist_position(33950, 3), 1)
+
+        self.assertTrue(main.scheduling.change(third, '33950', False))
+        self.assertEqual(self.query("SELECT * FROM waitlist"), [])
+
+    def test_reserve_keeps_a_seat_already_held(self):
+        main.set_capacity('33950', 1)
+        holder = self.student(1)
+        self.assertTrue(main.scheduling.change(holder, '33950', True))
+        course = main.course_cache.get('33950')
+        self.assertTrue(main.scheduling.reserve(self.student(1), '33950', course))
+        self.assertEqual(self.query("SELECT * FROM waitlist"), [])
+        self.assertEqual(self.query("SELECT TAKEN FROM seats"), [(1,)])
+
+    def test_raising_capacity_promotes_waitlist(self):
+        main.set_capacity('33950', 0)
+        for ID in (1, 2, 3):
+            main.scheduling.change(self.student(ID), '33950', True)
+        main.set_capacity('33950', 2)
+        self.assertEqual(self.query("SELECT USER_ID FROM enrollment ORDER BY USER_ID"), [(1,), (2,)])
+        self.assertEqual(self.query("SELECT TAKEN FROM seats"), [(2,)])
+        main.set_capacity('33950', None)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM enrollment"), [(3,)])
+
+    def test_promotion_skips_students_it_would_conflict_for(self):
+        with self.pool.connection() as conn:
+            conn.executemany("INSERT INTO courses VALUES (?,?,'ELEC',?,'M','Summer',2023,3)", [
+                (40001, 'LONG LAB', '9:00-12:00'), (40002, 'SEMINAR', '10:00-10:50')])
+        main.course_cache.invalidate()
+        main.set_capacity('40002', 1)
+        first, busy, free = self.student(1), self.student(2), self.student(3)
+        self.assertTrue(main.scheduling.change(first, '40002', True))
+        self.assertFalse(main.scheduling.change(busy, '40002', True))
+        # waitlisted sections aren't in the schedule, so the overlapping lab can still be added
+        self.assertTrue(main.scheduling.change(busy, '40001', True))
+        self.assertFalse(main.scheduling.change(free, '40002', True))
+
+        main.scheduling.change(first, '40002', False)
+        self.assertEqual(self.query("SELECT USER_ID, CRN FROM enrollment ORDER BY USER_ID"),
+                         [(2, 40001), (3, 40002)])
+        self.assertEqual(self.query("SELECT USER_ID FROM waitlist"), [(2,)])
+
+    def test_concurrent_adds_never_overbook(self):
+        main.set_capacity('33950', 5)
+        errors = []
+
+        def register(ID):
+            try:
+                main.scheduling.change(self.student(ID), '33950', True)
+            except sqlite3.Error as error:
+                errors.append(error)
+            finally:
+                self.pool.releaseThread(close=True)
+
+        threads = [threading.Thread(target=register, args=(ID,)) for ID in range(1, 41)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM enrollment"), [(5,)])
+        self.assertEqual(self.query("SELECT TAKEN FROM seats"), [(5,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM waitlist"), [(35,)])
+
+
+class BenchmarkTestCase(TestCase):
+    def setUp(self):
+        # use_database swaps these module globals, so put the originals back afterwards
+        self.patches = [patch('main.pool', main.pool), patch('main.db', main.db), patch('main.cursor', main.cursor)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        main.course_cache.invalidate()
+
+    def test_writes_machine_readable_results(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'results.json')
+            with patch('sys.stderr', new_callable=io.StringIO):
+                status = benchmark.main_benchmark(['--students', '200', '--repeat', '4', '--output', output,
+                                                   '--keep', tmpdir])
+            with open(output) as file:
+                report = json.load(file)
+            with sqlite3.connect(os.path.join(tmpdir, 'bench_200.db')) as conn:
+                counts = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                          for table in ('student', 'instructor', 'courses')]
+        self.assertEqual(status, 0)
+        self.assertEqual(counts, [200, 10, 20])
+        self.assertEqual([result['benchmark'] for result in report['results']], list(benchmark.BENCHMARKS))
+        self.assertTrue(all(result['median_ms'] >= 0 and result['scale'] == 200 for result in report['results']))
+
+    def test_regenerating_replaces_the_database(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.db')
+            benchmark.generate_database(path, 50, 3, 10)
+            benchmark.generate_database(path, 40, 3, 10)
+            main.pool.closeAll()
+            with sqlite3.connect(path) as conn:
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM student").fetchone(), (40,))
+
+    def test_finds_regressions(self):
+        baseline = {'results': [{'scale': 1000, 'benchmark': 'login', 'median_ms': 1.0}]}
+        self.assertEqual(benchmark.find_regressions([{'scale': 1000, 'benchmark': 'login', 'median_ms': 1.2}],
+                                                    baseline, 0.25), [])
+        self.assertEqual(len(benchmark.find_regressions([{'scale': 1000, 'benchmark': 'login', 'median_ms': 1.3}],
+                                                        baseline, 0.25)), 1)
+
+
+class LoadTestTestCase(TestCase):
+    def setUp(self):
+        self.patches = [patch('main.pool', main.pool), patch('main.db', main.db), patch('main.cursor', main.cursor)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        main.course_cache.invalidate()
+
+    def test_reports_every_operation(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'load.json')
+            with patch('sys.stderr', new_callable=io.StringIO):
+                loadtest.main_loadtest(['--students', '200', '--sessions', '4', '--duration', '0.3',
+                                        '--output', output])
+            with open(output) as file:
+                operations = json.load(file)['operations']
+        self.assertEqual(set(operations), {'login', 'search', 'add', 'drop', 'total'})
+        self.assertGreater(operations['total']['completed'], 0)
+        self.assertEqual((operations['total']['errors'], operations['total']['lock_errors']), (0, 0))
+        self.assertLessEqual(operations['search']['p50_ms'], operations['search']['p99_ms'])
+
+    def test_unexpected_errors_are_counted(self):
+        session = loadtest.LoadSession({'students': [(1, 'nobody')], 'terms': {}}, {'search': 1}, seed=0)
+        with patch('main.authenticate', return_value=None):
+            session.step()
+            session.step()
+        self.assertEqual(session.results['login'], {'latencies': [], 'errors': 2, 'lock_errors': 0})
+
+    def test_workload_searches_come_from_the_database(self):
+        main.migrate()
+        workload = loadtest.load_workload()
+        # assignment3.db only offers ELEC courses, not the generator's synthetic departments
+        self.assertEqual(workload['departments'], ['ELEC'])
+        self.assertIn('DIGITAL', workload['title_words'])
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('search=5,add=1'), {'search': 5, 'add': 1})
+        with self.assertRaises(Exception):
+            loadtest.parse_mix('enroll=1')
+
+
+class MigrationTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                               SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)", [
+            (33950, 'OLD TITLE', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3),
+            (34285, 'ADVANCED DIGITAL CIRCUIT DESIGN', 'ELEC', '12:30-13:50', 'WF', 'Summer', 2023, 4),
+            (33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3),
+        ])
+        self.cursor.execute("CREATE TABLE STUDENT (ID INT PRIMARY KEY NOT NULL, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL)")
+        self.cursor.execute("CREATE TABLE INSTRUCTOR (ID INT PRIMARY KEY NOT NULL, NAME, SURNAME, TITLE, HIREYEAR, DEPT, EMAIL)")
+        self.cursor.executemany("INSERT INTO INSTRUCTOR VALUES (?,?,?,?,?,?,?)", [
+            (20001, 'Joseph', 'Fourier', 'Full Prof.', 1820, 'BSEE', 'fourierj'),
+            (20002, 'Jean', 'Fourier', 'Full Prof.', 1820, 'BSEE', 'fourierj'),
+        ])
+        self.conn.commit()
+        self.patches = [patch('main.cursor', self.cursor), patch('main.db', self.conn), patch('main.print')]
+        self.mock_print = [p.start() for p in self.patches][2]
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def test_upgrades_old_database_once(self):
+        self.assertEqual(main.migrate(), len(main.MIGRATIONS))
+        self.assertEqual(main.migrate(), 0)
+        self.assertEqual(self.cursor.execute("PRAGMA user_version").fetchone()[0], len(main.MIGRATIONS))
+
+        self.assertEqual(self.cursor.execute("SELECT CRN, TITLE FROM courses ORDER BY CRN").fetchall(),
+                         [(33950, 'APPLIED PROGRAMMING CONCEPTS'), (34285, 'ADVANCED DIGITAL CIRCUIT DESIGN')])
+        self.assertEqual([c.CRN for c in main.search_courses(keywords='digital')], [34285])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.cursor.execute("INSERT INTO courses (CRN, TITLE) VALUES (34285, 'DUPLICATE')")
+
+        main.new_student(10001, 'Isaac', 'Newton', 1668, 'BSAS', 'newtoni')
+        main.new_student(10002, 'Someone', 'Else', 2024, 'BSAS', 'newtoni')
+        self.mock_print.assert_any_call("Error: User with email", 'newtoni', "already exists.")
+        self.assertEqual(self.cursor.execute("SELECT ID FROM student").fetchall(), [(10001,)])
+        self.mock_print.assert_any_call("Warning: instructor has duplicate emails, so its email index can't be unique.")
+
+    def test_non_numeric_crns_stop_the_upgrade(self):
+        self.cursor.execute("INSERT INTO courses (CRN, TITLE) VALUES ('TBA', 'UNSCHEDULED')")
+        self.conn.commit()
+        with self.assertRaisesRegex(main.MigrationError, r"row 4: CRN 'TBA' \(UNSCHEDULED\)"):
+            main.migrate()
+        self.assertEqual(self.cursor.execute("PRAGMA user_version").fetchone()[0], 1)
+
+        self.cursor.execute("DELETE FROM courses WHERE CRN='TBA'")
+        self.conn.commit()
+        main.migrate()
+        self.assertEqual(self.cursor.execute("SELECT CRN FROM courses ORDER BY CRN").fetchall(), [(33950,), (34285,)])
+
+    def test_failed_migration_rolls_back(self):
+        def broken():
+            self.cursor.execute("CREATE TABLE half_done (ID)")
+            raise sqlite3.OperationalError("boom")
+
+        with patch('main.MIGRATIONS', main.MIGRATIONS + [broken]):
+            with self.assertRaises(sqlite3.OperationalError):
+                main.migrate()
+        self.assertEqual(self.cursor.execute("PRAGMA user_version").fetchone()[0], len(main.MIGRATIONS))
+        self.assertFalse(main.table_exists('half_done'))
+
+
+class ConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = main.ConnectionPool(os.path.join(self.tmpdir.name, 'pool.db'))
+
+    def tearDown(self):
+        self.pool.closeAll()
+        self.tmpdir.cleanup()
+
+    def test_connections_are_tuned(self):
+        connection = self.pool.connection()
+        self.assertEqual(connection.execute("PRAGMA busy_timeout").fetchone()[0], 5000)
+        # opening a database leaves its journal mode alone; only migrate switches it
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], 'delete')
+
+    def test_migrated_databases_use_wal(self):
+        with patch('main.pool', self.pool), patch('main.db', main.ThreadConnection(self.pool)), \
+                patch('main.cursor', main.ThreadCursor(self.pool)):
+            main.migrate()
+        self.assertEqual(self.pool.connection().execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+    def test_each_thread_gets_its_own_connection(self):
+        seen = []
+        def work():
+            seen.append(self.pool.connection())
+        main_connection = self.pool.connection()
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen[0], main_connection)
+
+    def test_released_connections_are_reused(self):
+        with self.pool.session() as first:
+            pass
+        with self.pool.session() as second:
+            self.assertIs(first, second)
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = main.ConnectionPool(os.path.join(self.tmpdir.name, 'metrics.db'))
+        self.cursor = main.ThreadCursor(self.pool)
+        self.metrics = main.Metrics(slow_query_ms=1000)
+        self.patch = patch('main.metrics', self.metrics)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.pool.closeAll()
+        self.tmpdir.cleanup()
+
+    def test_queries_are_counted_with_rows(self):
+        self.cursor.execute("CREATE TABLE t (ID)")
+        self.cursor.executemany("INSERT INTO t VALUES (?)", [(1,), (2,), (3,)])
+        for _ in range(2):
+            self.cursor.execute("""SELECT ID
+                                   FROM t WHERE ID > ?""", (1,))
+            self.assertEqual(self.cursor.fetchall(), [(2,), (3,)])
+        self.assertEqual(list(self.cursor.execute("SELECT ID FROM t")), [(1,), (2,), (3,)])
+
+        queries = self.metrics.stats()['queries']
+        self.assertEqual(queries["SELECT ID FROM t WHERE ID > ?"]['calls'], 2)
+        self.assertEqual(queries["SELECT ID FROM t WHERE ID > ?"]['rows'], 4)
+        self.assertEqual(queries["SELECT ID FROM t"]['rows'], 3)
+        self.assertEqual(sum(queries["SELECT ID FROM t"]['histogram'].values()), 1)
+
+    def test_slow_queries_are_logged_with_parameters(self):
+        self.metrics.slow_query_ms = 0
+        self.metrics.slow_log_path = os.path.join(self.tmpdir.name, 'slow.log')
+        self.cursor.execute("SELECT ?, ?", (1, 'two'))
+        self.assertEqual(self.metrics.stats()['slow_queries'][0]['params'], [1, 'two'])
+        with open(self.metrics.slow_log_path) as log:
+            self.assertEqual(json.loads(log.readline())['sql'], "SELECT ?, ?")
+
+    def test_failed_queries_and_operations_count_as_errors(self):
+        @main.timed('broken')
+        def broken():
+            self.cursor.execute("SELECT * FROM missing")
+
+        with self.assertRaises(sqlite3.OperationalError):
+            broken()
+        stats = self.metrics.stats()
+        self.assertEqual(stats['queries']["SELECT * FROM missing"]['errors'], 1)
+        self.assertEqual(stats['operations']['broken']['errors'], 1)
+
+    def test_paging_waits_are_not_timed(self):
+        self.cursor.execute("CREATE TABLE courses (CRN)")
+        self.cursor.executemany("INSERT INTO courses VALUES (?)", [(n,) for n in range(5)])
+        def slow_choice(prompt):
+            time.sleep(0.05)
+            return 'n' if prompt.startswith('Page 1') else 'q'
+        with patch('main.cursor', self.cursor), patch('builtins.input', side_effect=slow_choice), \
+                patch('main.sys.stdout', new_callable=io.StringIO):
+            Admin('30001', 'Margaret', 'Hamilton', 'President', 'Dobbs 1600', 'hamiltonm').printRoster(page_size=3)
+        roster = self.metrics.stats()['operations']['print_roster']
+        self.assertEqual(roster['calls'], 2)
+        self.assertLess(roster['total_ms'], 50)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), "needs SIGUSR1")
+    def test_signal_dump_does_not_need_the_lock(self):
+        path = os.path.join(self.tmpdir.name, 'signal.json')
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            with patch.dict(os.environ, {'REGISTRATION_METRICS': path}):
+                main.install_metrics_signal()
+                with self.metrics.lock:
+                    os.kill(os.getpid(), signal.SIGUSR1)
+                for _ in range(100):
+                    if os.path.exists(path) and os.path.getsize(path):
+                        break
+                    time.sleep(0.02)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+        with open(path) as file:
+            self.assertIn('operations', json.load(file))
+
+    def test_stats_command_dumps_json(self):
+        with self.metrics.timed('search'):
+            pass
+        path = os.path.join(self.tmpdir.name, 'stats.json')
+        self.assertEqual(main.run_command(['stats', '--output', path]), 0)
+        with open(path) as file:
+            stats = json.load(file)
+        self.assertEqual(stats['operations']['search']['calls'], 1)
+        self.assertIn('hits', stats['course_cache'])
+
+
+class UserEditsTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("CREATE TABLE admin (ID INTEGER PRIMARY KEY, NAME, SURNAME, TITLE, OFFICE, EMAIL)")
+        self.cursor.execute("CREATE TABLE instructor (ID INTEGER PRIMARY KEY, NAME, SURNAME, TITLE, HIREYEAR, DEPT, EMAIL)")
+        self.cursor.execute("CREATE TABLE student (ID INTEGER PRIMARY KEY, NAME, SURNAME, GRADYEAR, MAJOR, EMAIL)")
+        self.cursor.executemany("INSERT INTO student VALUES (?,?,?,?,?,?)", [
+            (10001, 'Isaac', 'Newton', 1668, 'BSAS', 'newtoni'),
+            (10002, 'Marie', 'Curie', 1903, 'BSAS', 'curiem'),
+        ])
+        self.conn.commit()
+        self.patches = [patch('main.cursor', self.cursor), patch('main.db', self.conn), patch('main.print')]
+        for p in self.patches:
+            p.start()
+        main.create_enrollment_table()
+        main.create_seat_tables()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def test_modify_user_commits_all_edits_once(self):
+        inputs = ['10001', '5', 'BSEE', '6', 'newton', '7', 'Yes',
+                  '10002', '2', 'Maria', '7', 'No', 'Yes']
+        with patch('builtins.input', side_effect=inputs), patch.object(main, 'db', mock.Mock(wraps=self.conn)) as db:
+            Admin('30001', 'Margaret', 'Hamilton', 'President', 'Dobbs 1600', 'hamiltonm').modifyUser()
+            db.commit.assert_called_once()
+        self.assertEqual(self.cursor.execute("SELECT NAME, MAJOR, EMAIL FROM student ORDER BY ID").fetchall(),
+                         [('Isaac', 'BSEE', 'newton'), ('Maria', 'BSAS', 'curiem')])
+
+    def test_declining_the_save_discards_the_edits(self):
+        inputs = ['10001', '2', 'Isaak', '7', 'No', 'No']
+        with patch('builtins.input', side_effect=inputs), \
+                patch.object(main.UserEdits, 'discard', autospec=True, side_effect=main.UserEdits.discard) as discard:
+            Admin('30001', 'Margaret', 'Hamilton', 'President', 'Dobbs 1600', 'hamiltonm').modifyUser()
+        discard.assert_called_once()
+        self.assertEqual(len(discard.call_args.args[0]), 0)
+        self.assertEqual(self.cursor.execute("SELECT NAME FROM student WHERE ID=10001").fetchone(), ('Isaac',))
+
+    def test_changing_id_moves_enrollment_and_waitlist(self):
+        self.cursor.executemany("INSERT INTO enrollment VALUES (?,?,?,'Summer',2023)", [
+            (10001, 'student', 33950), (10001, 'instructor', 34285)])
+        self.cursor.execute("INSERT INTO waitlist (CRN, USER_ID) VALUES (34285, 10001)")
+        self.conn.commit()
+        edits = main.UserEdits()
+        edits.stage('student', '10001', 'ID', '10003')
+        edits.commit()
+        self.assertEqual(self.cursor.execute("SELECT USER_ID, ROLE FROM enrollment ORDER BY ROLE").fetchall(),
+                         [(10001, 'instructor'), (10003, 'student')])
+        self.assertEqual(self.cursor.execute("SELECT USER_ID FROM waitlist").fetchall(), [(10003,)])
+
+    def test_failed_edit_rolls_back_the_batch(self):
+        edits = main.UserEdits()
+        edits.stage('student', 10002, 'NAME', 'Maria')
+        edits.stage('student', 10001, 'ID', 10002)
+        with self.assertRaises(sqlite3.IntegrityError):
+            edits.commit()
+        self.assertEqual(self.cursor.execute("SELECT NAME FROM student WHERE ID=10002").fetchone(), ('Marie',))
+
+
+class BulkImportTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE student (ID INT PRIMARY KEY NOT NULL, NAME TEXT NOT NULL, SURNAME TEXT NOT NULL,
+                               GRADYEAR INT NOT NULL CHECK (GRADYEAR > 1000), MAJOR CHAR(4) NOT NULL,
+                               EMAIL TEXT NOT NULL)""")
+        self.cursor.execute("INSERT INTO student VALUES (10001, 'Isaac', 'Newton', 1668, 'BSAS', 'newtoni')")
+        self.conn.commit()
+        self.patches = [patch('main.cursor', self.cursor), patch('main.db', self.conn)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_csv_import_upserts_and_reports_bad_rows(self):
+        path = self.write('students.csv', "id,name,surname,gradyear,major,email\n"
+                                          "10001,Isaac,Newton,1700,BSEE,newtoni\n"
+                                          "10002,Marie,Curie,1903,BSAS,\n"
+                                          "10003,Nikola,Tesla,1878,BSEE,telsan\n")
+        report = main.import_file('student', path, chunk_size=1)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.errors, [(3, "missing EMAIL")])
+        self.assertEqual(self.cursor.execute("SELECT ID, GRADYEAR FROM student ORDER BY ID").fetchall(),
+                         [(10001, 1700), (10003, 1878)])
+
+    def test_failed_chunk_only_drops_the_failing_rows(self):
+        path = self.write('students.jsonl',
+                          '{"ID": 10002, "NAME": "Marie", "SURNAME": "Curie", "GRADYEAR": 1903, "MAJOR": "BSAS", "EMAIL": "curiem"}\n'
+                          'not json\n'
+                          '{"ID": 10002, "NAME": "Marie", "SURNAME": "Curie", "GRADYEAR": 1903, "MAJOR": "BSAS", "EMAIL": "curiem"}\n'
+                          '{"ID": 10010, "NAME": "Ada", "SURNAME": "Lovelace", "GRADYEAR": 5, "MAJOR": "BCOS", "EMAIL": "lovelacea"}\n')
+        report = main.import_file('student', path)
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.errors[0][0], 2)
+        self.assertEqual(report.errors[1], (4, "CHECK constraint failed: GRADYEAR > 1000"))
+        self.assertEqual(self.cursor.execute("SELECT ID FROM student ORDER BY ID").fetchall(), [(10001,), (10002,)])
+
+
+class BulkExportTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                               SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        self.rows = [(30000 + n, f'Course {n}', 'ELEC' if n % 2 else 'HUSS', '8:00-8:50', 'M',
+                      'Summer' if n < 7 else 'Fall', 2023, 3) for n in range(10)]
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)", self.rows)
+        self.patch = patch('main.cursor', self.cursor)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_columnar_round_trip_across_row_groups(self):
+        count = main.export_table('courses', self.path('courses.rcol'), batch_size=3)
+        self.assertEqual(count, 10)
+        self.assertEqual([tuple(row.values()) for row in main.read_columnar(self.path('courses.rcol'))], self.rows)
+
+    def test_filters_and_text_formats(self):
+        filters = {'semester': 'Summer', 'dept': 'ELEC'}
+        self.assertEqual(main.export_table('courses', self.path('courses.csv'), filters), 3)
+        with open(self.path('courses.csv')) as file:
+            self.assertEqual(file.readline().strip(), "CRN,TITLE,DEPT,TIME,DAYS,SEMESTER,YEAR,CREDITS")
+        main.export_table('courses', self.path('courses.jsonl'), {'semester': 'Fall'})
+        with open(self.path('courses.jsonl')) as file:
+            self.assertEqual([json.loads(line)['CRN'] for line in file], [30007, 30008, 30009])
+
+    def test_unsupported_filter_is_rejected(self):
+        with self.assertRaises(ValueError):
+            main.export_table('student', self.path('students.csv'), {'semester': 'Summer'})
+
+
+class CourseCacheTestCase(TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.cursor = self.conn.cursor()
+        self.cursor.execute("""CREATE TABLE courses (CRN INTEGER, TITLE TEXT, DEPT TEXT, TIME TEXT, DAYS TEXT,
+                               SEMESTER TEXT, YEAR INTEGER, CREDITS INTEGER)""")
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)",
+                                [(n, f'Course {n}', 'ELEC', '8:00-8:50', 'M', 'Summer', 2023, 3) for n in range(1, 5)])
+        self.mock_cursor = mock.Mock(wraps=self.cursor)
+        self.patches = [patch('main.cursor', self.mock_cursor), patch('main.db', self.conn),
+                        patch('main.course_cache', main.CourseCache(max_size=2))]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.conn.close()
+
+    def test_read_through_with_lru_eviction(self):
+        main.course_cache.get('1')
+        main.course_cache.get('1')
+        main.course_cache.getMany(['1', '2', '3'])
+        self.assertEqual(main.course_cache.stats(), {'hits': 2, 'misses': 3, 'size': 2, 'max_size': 2})
+        self.assertEqual(list(main.course_cache.entries), ['2', '3'])
+        self.assertEqual(main.course_cache.get('3').TITLE, 'Course 3')
+        self.assertIsNone(main.course_cache.get('99'))
+        self.assertEqual(self.mock_cursor.execute.call_count, 3)
+
+    def test_padded_crns_are_the_same_course(self):
+        self.assertEqual(main.course_cache.get('02').TITLE, 'Course 2')
+        self.assertEqual(list(main.course_cache.getMany(['2', ' 02', 2, '003'])), ['2', '3'])
+        self.assertEqual(main.course_cache.stats()['misses'], 2)
+
+    def test_fetch_binds_fixed_size_chunks(self):
+        self.cursor.executemany("INSERT INTO courses VALUES (?,?,?,?,?,?,?,?)",
+                                [(n, f'Course {n}', 'ELEC', '8:00-8:50', 'M', 'Fall', 2023, 3) for n in range(5, 151)])
+        self.assertEqual(main.fetch_courses([]), [])
+        self.assertEqual(self.mock_cursor.execute.call_count, 0)
+
+        crns = [str(n) for n in range(150, 0, -1)] + ["1 OR 1=1", '150']
+        courses = main.course_cache.getMany(crns)
+        self.assertEqual(list(courses), crns[:150])
+        self.assertIsInstance(courses['7'], main.Course)
+        queries = [c.args[0] for c in self.mock_cursor.execute.call_args_list]
+        self.assertEqual(queries, [main.FETCH_COURSES_QUERY] * 3)
+
+    def test_course_import_invalidates(self):
+        self.assertEqual(main.course_cache.get('4')[1], 'Course 4')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'courses.csv')
+            with open(path, 'w') as file:
+                file.write("CRN,TITLE,DEPT,TIME,DAYS,SEMESTER,YEAR,CREDITS\n4,Renamed,ELEC,8:00-8:50,M,Summer,2023,3\n")
+            main.import_file('courses', path)
+        self.assertEqual(main.course_cache.get('4')[1], 'Renamed')
+
+
+class ScheduleIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = main.ScheduleIndex([
+            main.Course(33950, 'APPLIED PROGRAMMING CONCEPTS', 'ELEC', '8:00-8:50', 'MW', 'Summer', 2023, 3),
+            main.Course(34285, 'ADVANCED DIGITAL CIRCUIT DESIGN', 'ELEC', '12:30-13:50', 'WF', 'Summer', 2023, 4),
+        ])
+
+    def test_overlapping_time_conflicts(self):
+        conflicts = self.index.conflicts(main.Course(33951, 'X', 'ELEC', '8:30-9:20', 'W', 'Summer', 2023, 3))
+        self.assertEqual([c[0] for c in conflicts], [33950])
+
+    def test_back_to_back_and_other_semester_do_not_conflict(self):
+        self.assertEqual(self.index.conflicts(main.Course(1, 'X', 'ELEC', '8:50-9:40', 'M', 'Summer', 2023, 3)), [])
+        self.assertEqual(self.index.conflicts(main.Course(2, 'X', 'ELEC', '8:00-8:50', 'M', 'Fall', 2023, 3)), [])
+
+    def test_overlapping_stored_schedule_still_conflicts(self):
+        index = main.ScheduleIndex([
+            main.Course(40001, 'LONG LAB', 'ELEC', '9:00-12:00', 'M', 'Summer', 2023, 3),
+            main.Course(40002, 'SEMINAR', 'ELEC', '10:00-10:50', 'M', 'Summer', 2023, 1),
+        ])
+        conflicts = index.conflicts(main.Course(40003, 'X', 'ELEC', '11:00-11:50', 'M', 'Summer', 2023, 3))
+        self.assertEqual([c[0] for c in conflicts], [40001])
+
+    def test_matches_a_full_scan_after_adds_and_removes(self):
+        rng = random.Random(1)
+        courses = []
+        for crn in range(1, 41):
+            start = rng.randrange(8 * 60, 17 * 60, 10)
+            end = start + rng.choice((50, 80, 170))
+            courses.append(main.Course(crn, 'X', 'ELEC', f"{start // 60}:{start % 60:02}-{end // 60}:{end % 60:02}",
+                                       'M', 'Summer', 2023, 3))
+        index = main.ScheduleIndex(courses)
+        for crn in range(1, 41, 3):
+            index.remove(str(crn))
+        kept = [c for c in courses if (c.CRN - 1) % 3]
+        for candidate in courses[:15]:
+            expected = {c.CRN for c in kept if c.meeting.START < candidate.meeting.END
+                        and candidate.meeting.START < c.meeting.END}
+            self.assertEqual({c.CRN for c in index.conflicts(candidate)}, expected)
+
+    def test_remove_clears_blocks(self):
+        self.index.remove('34285')
+        self.assertEqual(self.index.conflicts(main.Course(3, 'X', 'ELEC', '13:00-14:00', 'F', 'Summer', 2023, 3)), [])
+        self.assertEqual(self.index.scheduled, {'33950'})
+
+
+class MeetingTimeTestCase(TestCase):
+    def test_parses_time_and_days(self):
+        self.assertEqual(main.meeting_time('12:30-13:50', 'WF'), (750, 830, 0b10100))
+        self.assertEqual(main.meeting_time('TBA', 'MW'), (None, None, 0b101))
+        self.assertEqual(main.Course(1, 'X', 'ELEC', '8:00-8:50', 'R', 'Fall', 2023, 3).meeting.DAYS, 0b1000)
+
+    def test_schedule_prints_in_time_order(self):
+        courses = [main.Course(1, 'LATE', 'ELEC', '10:00-10:50', 'MW', 'Fall', 2023, 3),
+                   main.Course(2, 'EARLY', 'ELEC', '9:00-9:50', 'MW', 'Fall', 2023, 3),
+                   main.Course(3, 'AFTERNOON', 'ELEC', '13:00-14:20', 'TR', 'Fall', 2023, 3)]
+        with patch('builtins.print') as mock_print:
+            main.print_schedule(courses)
+        lines = [c.args[0] for c in mock_print.call_args_list]
+        self.assertEqual(lines[1:-1], ["\nMonday, Wednesday:",
+                                       "CRN: 2 | Course: EARLY | Time: 9:00 AM-9:50 AM",
+                                       "CRN: 1 | Course: LATE | Time: 10:00 AM-10:50 AM",
+                                       "\nTuesday, Thursday:",
+                                       "CRN: 3 | Course: AFTERNOON | Time: 1:00 PM-2:20 PM"])
+
+
 class ScheduleTestCase(unittest.TestCase):
     def setUp(self):
         # Set up the test database
         main.db = main.sqlite3.connect(":memory:")
         main.cursor = main.db.cursor()
+        main.course_cache.invalidate()
         main.cursor.execute("""CREATE TABLE IF NOT EXISTS courses (
                                 CRN TEXT,
                                 TITLE TEXT,
@@ -313,43 +1299,53 @@ class ScheduleTestCase(unittest.TestCase):
         main.cursor.execute("DROP TABLE IF EXISTS courses")
         main.db.close()
 
-    def test_student_add_drop_course(self):
-        with mock.patch("main.cursor") as mock_cursor:
-            student = main.student('10012', 'Jack', 'Krupienski', '2024', 'CE', 'krupienskij')
-            student.schedule = ["11111", "22222"]
+    def add_courses_and_enroll(self, member):
+        main.migrate()
+        main.cursor.executemany("INSERT INTO courses VALUES (?,?,'ELEC',?,'MW','Summer','2023','3')", [
+            ('11111', 'FIRST', '8:00-8:50'), ('22222', 'SECOND', '9:00-9:50'), ('33333', 'THIRD', '10:00-10:50')])
+        main.cursor.executemany("INSERT INTO enrollment VALUES (?,?,?,'Summer',2023)",
+                                [(member.ID, member.role, crn) for crn in (11111, 22222)])
+        main.db.commit()
+        member.loadSchedule()
 
-            # Mock the input to simulate user input
-            with mock.patch("builtins.input", side_effect=["33333", "22222"]):
-                student.addDropCourse(True)
-                student.addDropCourse(False)
+    def test_student_add_drop_course(self):
+        student = main.student('10012', 'Jack', 'Krupienski', '2024', 'CE', 'krupienskij')
+        self.add_courses_and_enroll(student)
 
-                # Assert that the cursor executed the SQL SELECT statements to check for course data
-                mock_cursor.execute.assert_any_call("SELECT * FROM courses WHERE CRN=?", ("33333",))
-                mock_cursor.execute.assert_any_call("SELECT * FROM courses WHERE CRN=?", ("22222",))
+        # Mock the input to simulate user input
+        with mock.patch("builtins.input", side_effect=["33333", "22222"]), mock.patch("builtins.print"):
+            student.addDropCourse(True)
+            student.addDropCourse(False)
 
-                # Assert that the course was added and then dropped from the student's schedule
-                self.assertIn("33333", student.schedule)
-                self.assertNotIn("22222", student.schedule)
-                print("Student schedule after adding and dropping courses:", student.schedule)
+        # Assert that the course was added and then dropped from the student's schedule
+        self.assertIn("33333", student.schedule)
+        self.assertNotIn("22222", student.schedule)
+        self.assertEqual(main.cursor.execute("SELECT CRN FROM enrollment ORDER BY CRN").fetchall(), [(11111,), (33333,)])
 
     def test_instructor_add_drop_course(self):
-        with mock.patch("main.cursor") as mock_cursor:
-            instructor = main.instructor('002', 'Luke', 'Bassett', 'teacher', '2020', 'math', 'bassettl')
-            instructor.schedule = ["11111", "22222"]
-
-            # Mock the input to simulate user input
-            with mock.patch("builtins.input", side_effect=["33333", "22222"]):
-                instructor.addDropCourse(True)
-                instructor.addDropCourse(False)
-
-                # Assert that the cursor executed the SQL SELECT statements to check for course data
-                mock_cursor.execute.assert_any_call("SELECT * FROM courses WHERE CRN=?", ("33333",))
-                mock_cursor.execute.assert_any_call("SELECT * FROM courses WHERE CRN=?", ("22222",))
-
-                # Assert that the course was added and then dropped from the instructor's schedule
-                self.assertIn("33333", instructor.schedule)
-                self.assertNotIn("22222", instructor.schedule)
-                print("Instructor schedule after adding and dropping courses:", instructor.schedule)
+        instructor = main.instructor('002', 'Luke', 'Bassett', 'teacher', '2020', 'math', 'bassettl')
+        self.add_courses_and_enroll(instructor)
+
+        # Mock the input to simulate user input
+        with mock.patch("builtins.input", side_effect=["33333", "22222"]), mock.patch("builtins.print"):
+            instructor.addDropCourse(True)
+            instructor.addDropCourse(False)
+
+        # Assert that the course was added and then dropped from the instructor's schedule
+        self.assertIn("33333", instructor.schedule)
+        self.assertNotIn("22222", instructor.schedule)
+
+    def test_schedule_changed_by_another_session_is_reread(self):
+        student = main.student('10012', 'Jack', 'Krupienski', '2024', 'CE', 'krupienskij')
+        self.add_courses_and_enroll(student)
+        # promoted off the waitlist in another session while this one still has the old schedule
+        main.cursor.execute("INSERT INTO enrollment VALUES (10012, 'student', 33333, 'Summer', 2023)")
+        main.db.commit()
+        with mock.patch("builtins.print") as mock_print:
+            self.assertFalse(main.scheduling.change(student, '33333', True))
+            mock_print.assert_called_with("Course with CRN", "33333", "is already in your schedule.")
+            self.assertTrue(main.scheduling.change(student, '33333', False))
+        self.assertEqual(main.cursor.execute("SELECT COUNT(*) FROM waitlist").fetchone(), (0,))
 
 if __name__ == '__main__':
     unittest.main()